@@ -9,6 +9,7 @@ from flask_pagedown import PageDown
 from flask_images import Images
 
 from config import config
+from .upload_request import UploadRequest
 
 mail = Mail()
 moment = Moment()
@@ -25,6 +26,7 @@ login_manager.login_view = 'auth.login'
 
 def create_app(config_name: str) -> Flask:
     app = Flask(__name__)
+    app.request_class = UploadRequest
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
@@ -4,22 +4,15 @@ from . import api
 from .decorators import permission_required
 from app import db
 from app.models import Post, Permission, Comment
+from app.pagination import make_keyset_pagination, keyset_links
 
 
 @api.route('/comments/')
 def get_comments():
-    page = request.args.get('page', 1, type=int)
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(
-        page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
-        error_out=False)
-    comments = pagination.items
-    prev_page = url_for('api.get_comments', page=page - 1) if pagination.has_prev else None
-    next_page = url_for('api.get_comments', page=page + 1) if pagination.has_next else None
+    pagination = make_keyset_pagination(Comment.query, Comment, current_app.config['FLASKY_COMMENTS_PER_PAGE'])
     return jsonify({
-        'comments': [comment.to_json() for comment in comments],
-        'prev': prev_page,
-        'next': next_page,
-        'count': pagination.total
+        'comments': [comment.to_json() for comment in pagination.items],
+        **keyset_links(pagination, 'api.get_comments')
     })
 
 
@@ -32,18 +25,11 @@ def get_comment(comment_id):
 @api.route('/posts/<post_id>/comments/')
 def get_post_comments(post_id):
     post = Post.query.get_or_404(post_id)
-    page = request.args.get('page', 1, type=int)
-    pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(
-        page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
-        error_out=False)
-    comments = pagination.items
-    prev_page = url_for('api.get_post_comments', id=post_id, page=page - 1) if pagination.has_prev else None
-    next_page = url_for('api.get_post_comments', id=post_id, page=page + 1) if pagination.has_next else None
+    pagination = make_keyset_pagination(post.comments, Comment, current_app.config['FLASKY_COMMENTS_PER_PAGE'],
+                                        descending=False)
     return jsonify({
-        'comments': [comment.to_json() for comment in comments],
-        'prev': prev_page,
-        'next': next_page,
-        'count': pagination.total
+        'comments': [comment.to_json() for comment in pagination.items],
+        **keyset_links(pagination, 'api.get_post_comments', post_id=post_id)
     })
 
 
@@ -1,7 +1,7 @@
 from flask import jsonify
 
 from . import api
-from ..exceptions import ValidationError, RequestBodyEmpty
+from ..exceptions import ValidationError, RequestBodyEmpty, InvalidCursor
 
 
 def bad_request(message: str):
@@ -30,3 +30,8 @@ def validation_error(err: ValidationError):
 @api.errorhandler(RequestBodyEmpty)
 def request_body_empty(err: RequestBodyEmpty):
     return bad_request(err.args[0])
+
+
+@api.errorhandler(InvalidCursor)
+def invalid_cursor(err: InvalidCursor):
+    return bad_request(err.args[0])
@@ -7,23 +7,16 @@ from .errors import forbidden
 from app import db
 from app.models import Post, Permission
 from app.exceptions import RequestBodyEmpty
+from app.pagination import make_keyset_pagination, keyset_links
 
 
 @api.route('/posts/')
 @auth.login_required
 def get_posts():
-    page = request.args.get('page', 1, type=int)
-    pagination = Post.query.paginate(
-        page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-        error_out=False)
-    posts = pagination.items
-    prev_page = url_for('api.get_posts', page=page-1) if pagination.has_prev else None
-    next_page = url_for('api.get_posts', page=page+1) if pagination.has_next else None
+    pagination = make_keyset_pagination(Post.query, Post, current_app.config['FLASKY_POSTS_PER_PAGE'])
     return jsonify({
-        'posts': [post.to_json() for post in posts],
-        'prev': prev_page,
-        'next': next_page,
-        'count': pagination.total
+        'posts': [post.to_json() for post in pagination.items],
+        **keyset_links(pagination, 'api.get_posts')
     })
 
 
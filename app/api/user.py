@@ -1,6 +1,7 @@
-from flask import jsonify, request, current_app, url_for
+from flask import jsonify, current_app
 from . import api
-from ..models import User, Post
+from ..models import User, Post, Images
+from ..pagination import make_keyset_pagination, make_merged_keyset_pagination, keyset_links
 
 
 @api.route('/users/<int:user_id>')
@@ -12,34 +13,28 @@ def get_user(user_id):
 @api.route('/users/<int:user_id>/posts/')
 def get_user_posts(user_id):
     user: User = User.query.get_or_404(user_id)
-    page = request.args.get('page', 1, type=int)
-    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(
-        page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-        error_out=False)
-    posts = pagination.items
-    prev_page = url_for('api.get_user_posts', user_id=user_id, page=page - 1) if pagination.has_prev else None
-    next_page = url_for('api.get_user_posts', user_id=user_id, page=page + 1) if pagination.has_next else None
+    pagination = make_keyset_pagination(user.posts, Post, current_app.config['FLASKY_POSTS_PER_PAGE'])
     return jsonify({
-        'posts': [post.to_json() for post in posts],
-        'prev': prev_page,
-        'next': next_page,
-        'count': pagination.total
+        'posts': [post.to_json() for post in pagination.items],
+        **keyset_links(pagination, 'api.get_user_posts', user_id=user_id)
     })
 
 
 @api.route('/users/<int:user_id>/timeline/')
 def get_user_followed_posts(user_id):
     user = User.query.get_or_404(user_id)
-    page = request.args.get('page', 1, type=int)
-    pagination = user.followed_posts.order_by(Post.timestamp.desc()).paginate(
-        page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-        error_out=False)
-    posts = pagination.items
-    prev_page = url_for('api.get_user_followed_posts', user_id=user_id, page=page - 1) if pagination.has_prev else None
-    next_page = url_for('api.get_user_followed_posts', user_id=user_id, page=page + 1) if pagination.has_next else None
+    pagination = make_merged_keyset_pagination(user.timeline_sources(), current_app.config['FLASKY_POSTS_PER_PAGE'])
     return jsonify({
-        'posts': [post.to_json() for post in posts],
-        'prev': prev_page,
-        'next': next_page,
-        'count': pagination.total
+        'posts': [post.to_json() for post in pagination.items],
+        **keyset_links(pagination, 'api.get_user_followed_posts', user_id=user_id)
+    })
+
+
+@api.route('/users/<int:user_id>/images/')
+def get_user_images(user_id):
+    user = User.query.get_or_404(user_id)
+    pagination = make_keyset_pagination(user.images, Images, current_app.config['FLASKY_IMAGES_PER_PAGE'])
+    return jsonify({
+        'images': [image.to_json() for image in pagination.items],
+        **keyset_links(pagination, 'api.get_user_images', user_id=user_id)
     })
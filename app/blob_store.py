@@ -0,0 +1,115 @@
+import hashlib
+import os
+from os import makedirs, remove, replace, link
+from os.path import join, exists, dirname, basename, splitext
+from tempfile import NamedTemporaryFile
+from typing import BinaryIO, Optional
+
+
+_umask = os.umask(0o022)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask  # temporary files are made 0600, static files must be readable by the web server
+
+
+def make_readable(path: str):
+    """Give the file the usual mode of new files, before it is placed under the static folder"""
+    os.chmod(path, FILE_MODE)
+
+
+class BlobStore:
+    """Content-addressed image files under the static folder.
+    File is named by SHA-256 of its content and fanned out by the leading hash characters:
+    images/blobs/ab/cd/abcd....png, so equal files are stored once for all users.
+    """
+    root = join('images', 'blobs')
+    fan_out = 2  # directory levels, two hash characters each
+    chunk_size = 1 << 16
+
+    def __init__(self, static_path: str):
+        self.static_path = static_path
+
+    @classmethod
+    def relative_path(cls, filename: str) -> str:
+        """Path relative to static folder of the blob filename: hash with extension"""
+        levels = [filename[2 * level:2 * level + 2] for level in range(cls.fan_out)]
+        return join(cls.root, *levels, filename).replace('\\', '/')
+
+    @classmethod
+    def is_blob(cls, path: str) -> bool:
+        """Is the path relative to static folder in the store"""
+        return path.replace('\\', '/').startswith(cls.root.replace('\\', '/') + '/')
+
+    @staticmethod
+    def blob_hash(path: str) -> str:
+        return splitext(basename(path))[0]
+
+    def abs_path(self, path: str) -> str:
+        return join(self.static_path, path)
+
+    def put_stream(self, stream: BinaryIO, extension: str) -> str:
+        """Store content of the stream
+        :param extension: with the dot, e.g. '.png'
+        :return: blob filename
+        """
+        tmp_dir = self.abs_path(self.root)
+        makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        with NamedTemporaryFile(dir=tmp_dir, suffix='.tmp', delete=False) as tmp:
+            for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                digest.update(chunk)
+                tmp.write(chunk)
+        return self._place(tmp.name, digest.hexdigest() + extension.lower())
+
+    def put_file(self, path: str, move: bool = False, extension: Optional[str] = None) -> str:
+        """Store the file, it is hard linked when possible, so no data is copied
+        :param move: remove the source file
+        :param extension: by default extension of the path
+        :return: blob filename
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(self.chunk_size), b''):
+                digest.update(chunk)
+        filename = digest.hexdigest() + (extension or splitext(path)[1]).lower()
+        if move:
+            return self._place(path, filename)
+
+        blob_path = self.abs_path(self.relative_path(filename))
+        if exists(blob_path):
+            self.touch(blob_path)
+        else:
+            makedirs(dirname(blob_path), exist_ok=True)
+            try:
+                make_readable(path)  # the link shares the mode, spooled uploads are 0600
+                link(path, blob_path)
+            except FileExistsError:
+                pass
+            except OSError:
+                with open(path, 'rb') as file:
+                    return self.put_stream(file, extension or splitext(path)[1])
+        return filename
+
+    def _place(self, path: str, filename: str) -> str:
+        """Move the file to the blob path, or drop it if the blob already exists"""
+        blob_path = self.abs_path(self.relative_path(filename))
+        if exists(blob_path):
+            remove(path)
+            self.touch(blob_path)
+        else:
+            makedirs(dirname(blob_path), exist_ok=True)
+            make_readable(path)
+            replace(path, blob_path)
+        return filename
+
+    @staticmethod
+    def touch(blob_path: str):
+        """Stored again, so garbage collection of unreferenced blobs waits for its reference"""
+        try:
+            os.utime(blob_path)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, filename: str):
+        blob_path = self.abs_path(self.relative_path(filename))
+        if exists(blob_path):
+            remove(blob_path)
@@ -4,3 +4,15 @@ class ValidationError(ValueError):
 
 class RequestBodyEmpty(ValueError):
     pass
+
+
+class JobRejected(ValueError):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class InvalidCursor(ValueError):
+    pass
@@ -0,0 +1,70 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Sequence, Tuple
+
+from markdown import Markdown
+
+
+class MarkdownRenderer:
+    """HTML of post and comment bodies.
+    Every thread reuses one Markdown instance, and rendered HTML is kept in an LRU cache
+    keyed by the hash of the body, so equal bodies and repeated sets are rendered once.
+    """
+    extensions = ('extra', 'codehilite')
+
+    def __init__(self, cache_size: int = 1024):
+        """
+        :param cache_size: rendered bodies kept in memory, 0 disables the cache
+        """
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def markdown(self) -> 'Markdown':
+        """Markdown instance of the current thread"""
+        md = getattr(self._local, 'markdown', None)
+        if md is None:
+            md = self._local.markdown = Markdown(extensions=list(self.extensions))
+        return md
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256('\0'.join(self.extensions + (text,)).encode('utf-8')).hexdigest()
+
+    def convert(self, text: str) -> str:
+        """Render without the cache"""
+        md = self.markdown
+        try:
+            return md.convert(text)
+        finally:
+            md.reset()
+
+    def render(self, text: str) -> str:
+        if not self.cache_size:
+            return self.convert(text)
+        key = self.key(text)
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                return html
+        html = self.convert(text)
+        with self._lock:
+            self._cache[key] = html
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+default_markdown_renderer = MarkdownRenderer()
+
+
+def render_batch(rows: Sequence[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Render (id, body) rows, runs in worker processes of the re-render command"""
+    return [(row_id, default_markdown_renderer.convert(body or '')) for row_id, body in rows]
@@ -1,19 +1,29 @@
 import hashlib
-from datetime import datetime
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from glob import glob
+from math import isfinite
+from os import remove
+from os.path import join, exists, getmtime, getsize, relpath, basename, dirname
 from random import seed, randint
-from typing import Tuple, Dict, Union, Optional, List
+from typing import Callable, Hashable, Tuple, Dict, Union, Optional, List
 
 import forgery_py
 from flask import current_app, Flask, request, url_for
 from flask_login import UserMixin, AnonymousUserMixin
 from flask_sqlalchemy import BaseQuery
 from itsdangerous import BadSignature, TimedJSONWebSignatureSerializer as Serializer
-from markdown import markdown
+from sqlalchemy import func, or_, select, and_
 from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from . import db, login_manager
-from .exceptions import ValidationError
+from .blob_store import BlobStore
+from .exceptions import ValidationError, JobRejected
+from .images_path import ImagesPath
+from .markdown_renderer import default_markdown_renderer, render_batch
+from .renditions import Renditions
 
 current_app: Flask
 
@@ -31,15 +41,48 @@ class Permission:
     ADMIN = 0xff
 
 
+class CounterCallback:
+    """Denormalized counters, which are changed in the flush of the counted rows"""
+
+    @staticmethod
+    def increment(connection, counter: 'db.Column', row_id: Optional[int], delta: int):
+        if row_id is None or not delta:
+            return
+        table = counter.table
+        connection.execute(table.update().where(table.c.id == row_id).values({counter: counter + delta}))
+
+
 class PostsCallback:
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        extensions = [
-            'extra',
-            'codehilite',
-        ]
-        target.body_html = markdown(value, extensions=extensions)
+        target.body_html = default_markdown_renderer.render(value)
+
+    @classmethod
+    def rerender(cls, workers: int = 4, batch_size: int = 100) -> int:
+        """Render body_html of all rows again, e.g. after markdown extensions are changed
+        :param workers: processes rendering batches, 1 to render in this process
+        :param batch_size: rows rendered by a process at once and updated by one statement
+        :return: count of rendered rows
+        """
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        rendered, last_id = 0, 0
+        try:
+            while True:
+                rows = db.session.query(cls.id, cls.body).filter(cls.id > last_id).order_by(cls.id).limit(
+                    workers * batch_size).all()
+                if not rows:
+                    return rendered
+                last_id = rows[-1].id
+                batches = [[tuple(row) for row in rows[start:start + batch_size]]
+                           for start in range(0, len(rows), batch_size)]
+                for batch in pool.map(render_batch, batches) if pool else map(render_batch, batches):
+                    db.session.bulk_update_mappings(cls, [{'id': row_id, 'body_html': html} for row_id, html in batch])
+                    rendered += len(batch)
+                db.session.commit()
+        finally:
+            if pool:
+                pool.shutdown()
 
 
 class Role(db.Model):
@@ -96,6 +139,14 @@ class Follow(db.Model):
         self.follower = follower
         self.followed = followed
 
+    @staticmethod
+    def on_inserted(mapper, connection, target: 'Follow'):
+        TimelineEntry.follow(connection, target.follower_id, target.followed_id)
+
+    @staticmethod
+    def on_deleted(mapper, connection, target: 'Follow'):
+        TimelineEntry.unfollow(connection, target.follower_id, target.followed_id)
+
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -112,11 +163,15 @@ class User(UserMixin, db.Model):
     member_since = db.Column(db.DateTime(), default=datetime.utcnow)
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     avatar_hash = db.Column(db.String(32))
+    post_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    # posts are written to timelines of followers, False for authors with too many followers
+    timeline_fanout = db.Column(db.Boolean, default=True, nullable=False, server_default='1')
 
     role_id = db.Column(db.Integer, db.ForeignKey('roles.id'))
 
     posts = db.relationship('Post', backref='author', lazy='dynamic')
     images = db.relationship('Images', backref='author', lazy='dynamic')
+    transfer_jobs = db.relationship('TransferJob', backref='author', lazy='dynamic')
     followed = db.relationship('Follow',
                                foreign_keys=[Follow.follower_id],
                                backref=db.backref('follower', lazy='joined'),
@@ -150,9 +205,9 @@ class User(UserMixin, db.Model):
                 self.role = Role.query.filter_by(default=True).first()
 
         if self.email and not self.avatar_hash:
-            self.make_email_hash()
+            self.avatar_hash = self.make_email_hash()
 
-        self.follow(self)
+        Follow(self, self)  # saved together with the user
 
     @property
     def password(self):
@@ -256,11 +311,8 @@ class User(UserMixin, db.Model):
         db.session.add(self)
         db.session.commit()
 
-    def make_email_hash(self):
-        self.avatar_hash = hashlib.md5(self.email.encode('utf-8')).hexdigest()
-        db.session.add(self)
-        db.session.commit()
-        return self.avatar_hash
+    def make_email_hash(self) -> str:
+        return hashlib.md5(self.email.encode('utf-8')).hexdigest()
 
     @staticmethod
     def generate_fake(count: int = 100):
@@ -306,10 +358,24 @@ class User(UserMixin, db.Model):
         else:
             return cls.query.filter_by(username=username).first()
 
+    def timeline_sources(self) -> list:
+        """Queries of the home timeline with their (timestamp, id) key columns, see MergedKeysetPagination:
+        posts of the materialized timeline, paged by its (user_id, timestamp, post_id) index,
+        and posts of followed authors, which are read on every load because of their follower count
+        """
+        read_authors = db.session.query(Follow.followed_id).join(User, User.id == Follow.followed_id).filter(
+            Follow.follower_id == self.id, User.timeline_fanout.is_(False))
+        return [
+            (Post.query.join(TimelineEntry, TimelineEntry.post_id == Post.id).filter(TimelineEntry.user_id == self.id),
+             TimelineEntry.timestamp, TimelineEntry.post_id),
+            (Post.query.filter(Post.author_id.in_(read_authors)), Post.timestamp, Post.id)
+        ]
+
     @property
     def followed_posts(self) -> List['Post']:
-        """Return posts of authors that follow user"""
-        return Post.query.join(Follow, Follow.followed_id == Post.author_id).filter(Follow.follower_id == self.id)
+        """Return posts of authors that follow user, the queries of timeline_sources in one"""
+        (timeline, _, _), (read_posts, _, _) = self.timeline_sources()
+        return timeline.union_all(read_posts)
 
     @classmethod
     def add_self_follows(cls):
@@ -319,6 +385,17 @@ class User(UserMixin, db.Model):
                 db.session.add(user)
                 db.session.commit()
 
+    @classmethod
+    def repair_post_counts(cls) -> int:
+        """Recompute post_count of all users in one statement
+        :return: count of users, which counter was wrong
+        """
+        actual = db.session.query(func.count(Post.id)).filter(Post.author_id == cls.id).scalar_subquery()
+        wrong = cls.query.filter(cls.post_count != actual).count()
+        cls.query.update({'post_count': actual}, synchronize_session=False)
+        db.session.commit()
+        return wrong
+
     def to_json(self) -> dict:
         json_user = {
             'url':  url_for('api.get_user', user_id=self.id, _external=True),
@@ -327,7 +404,7 @@ class User(UserMixin, db.Model):
             'last_seen': self.last_seen,
             'posts': url_for('api.get_user_posts', user_id=self.id, _external=True),
             'followed_posts': url_for('api.get_user_followed_posts', user_id=self.id, _external=True),
-            'post_count': self.posts.count()
+            'post_count': self.post_count
         }
         return json_user
 
@@ -346,6 +423,7 @@ login_manager.anonymous_user = AnonymousUser
 
 class Post(db.Model, PostsCallback):
     __tablename__ = 'posts'
+    __table_args__ = (db.Index('ix_posts_author_timestamp', 'author_id', 'timestamp'),)
     query: BaseQuery
 
     id = db.Column(db.Integer, primary_key=True)
@@ -355,6 +433,8 @@ class Post(db.Model, PostsCallback):
 
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
+    comment_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')  # not disabled comments
+
     comments = db.relationship('Comment', backref='post', lazy='dynamic')
 
     def __init__(self, body: str, author: Optional[User], timestamp: str = None):
@@ -382,10 +462,36 @@ class Post(db.Model, PostsCallback):
             'timestamp': self.timestamp,
             'author': url_for('api.get_user', user_id=self.author_id, _external=True),
             'comments': url_for('api.get_comments', comment_id=self.id, _external=True),
-            'comment_count': self.comments.count()
+            'comment_count': self.comment_count
         }
         return json_post
 
+    @staticmethod
+    def on_inserted(mapper, connection, target: 'Post'):
+        CounterCallback.increment(connection, User.__table__.c.post_count, target.author_id, 1)
+        TimelineEntry.fan_out(connection, target.id)
+
+    @staticmethod
+    def on_deleting(mapper, connection, target: 'Post'):
+        """Timeline entries reference the post, so they go first"""
+        connection.execute(TimelineEntry.__table__.delete().where(TimelineEntry.__table__.c.post_id == target.id))
+
+    @staticmethod
+    def on_deleted(mapper, connection, target: 'Post'):
+        CounterCallback.increment(connection, User.__table__.c.post_count, target.author_id, -1)
+
+    @classmethod
+    def repair_comment_counts(cls) -> int:
+        """Recompute comment_count of all posts in one statement
+        :return: count of posts, which counter was wrong
+        """
+        actual = db.session.query(func.count(Comment.id)).filter(Comment.post_id == cls.id,
+                                                                 Comment.disabled.isnot(True)).scalar_subquery()
+        wrong = cls.query.filter(cls.comment_count != actual).count()
+        cls.query.update({'comment_count': actual}, synchronize_session=False)
+        db.session.commit()
+        return wrong
+
     @staticmethod
     def from_json(json_post: dict) -> 'Post':
         body = json_post.get('body')
@@ -402,7 +508,7 @@ class Comment(db.Model, PostsCallback):
     body = db.Column(db.Text)
     body_html = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
-    disabled = db.Column(db.Boolean)
+    disabled = db.column_property(db.Column(db.Boolean), active_history=True)  # old value for comment_count
 
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
@@ -413,21 +519,590 @@ class Comment(db.Model, PostsCallback):
         self.author = author
         self.post = post
 
+    @staticmethod
+    def on_inserted(mapper, connection, target: 'Comment'):
+        if not target.disabled:
+            CounterCallback.increment(connection, Post.__table__.c.comment_count, target.post_id, 1)
+
+    @staticmethod
+    def on_deleted(mapper, connection, target: 'Comment'):
+        if not target.disabled:
+            CounterCallback.increment(connection, Post.__table__.c.comment_count, target.post_id, -1)
+
+    @staticmethod
+    def on_updated(mapper, connection, target: 'Comment'):
+        history = db.inspect(target).attrs.disabled.history
+        if not history.has_changes():
+            return
+        was_disabled = bool(history.deleted and history.deleted[0])
+        if was_disabled != bool(target.disabled):
+            CounterCallback.increment(connection, Post.__table__.c.comment_count, target.post_id,
+                                      -1 if target.disabled else 1)
+
 
 db.event.listen(Post.body, 'set', Post.on_changed_body)
 db.event.listen(Comment.body, 'set', Comment.on_changed_body)
+db.event.listen(Post, 'after_insert', Post.on_inserted)
+db.event.listen(Post, 'before_delete', Post.on_deleting)
+db.event.listen(Post, 'after_delete', Post.on_deleted)
+db.event.listen(Comment, 'after_insert', Comment.on_inserted)
+db.event.listen(Comment, 'after_delete', Comment.on_deleted)
+db.event.listen(Comment, 'after_update', Comment.on_updated)
+
+
+class TimelineEntry(db.Model):
+    """Materialized home timelines: posts of followed authors by user, written when a post is made
+    or an author is followed. Posts of authors with more than FLASKY_TIMELINE_FANOUT_LIMIT followers
+    are not written, User.timeline_sources reads them from posts.
+    Entries keep the post timestamp, so a page of the timeline is a range of the user's index.
+    """
+    __tablename__ = 'timeline_entries'
+    __table_args__ = (db.Index('ix_timeline_entries_user_timestamp', 'user_id', 'timestamp', 'post_id'),)
+    query: BaseQuery
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True, index=True)
+    timestamp = db.Column(db.DateTime, nullable=False)  # of the post
+
+    columns = ['user_id', 'post_id', 'timestamp']
+
+    @staticmethod
+    def fan_out(connection, post_id: int):
+        """Write the new post to timelines of the author's followers"""
+        follows, users, posts = Follow.__table__, User.__table__, Post.__table__
+        followers = select([follows.c.follower_id, posts.c.id, posts.c.timestamp]).select_from(
+            posts.join(users, users.c.id == posts.c.author_id).join(follows, follows.c.followed_id == users.c.id)
+        ).where(and_(posts.c.id == post_id, users.c.timeline_fanout.is_(True)))
+        connection.execute(TimelineEntry.__table__.insert().from_select(TimelineEntry.columns, followers))
+
+    @staticmethod
+    def follow(connection, follower_id: int, followed_id: int):
+        """Write posts of the followed author to the follower's timeline,
+        the author stops fanning out, when the follower count exceeds the limit:
+        the author's posts are removed from all timelines and read from posts instead
+        """
+        table, follows, users, posts = TimelineEntry.__table__, Follow.__table__, User.__table__, Post.__table__
+        followers = connection.execute(
+            select([func.count()]).select_from(follows).where(follows.c.followed_id == followed_id)).scalar()
+        if followers > current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT']:
+            stopped = connection.execute(users.update().where(
+                and_(users.c.id == followed_id, users.c.timeline_fanout.is_(True))).values(timeline_fanout=False))
+            if stopped.rowcount:
+                connection.execute(table.delete().where(
+                    table.c.post_id.in_(select([posts.c.id]).where(posts.c.author_id == followed_id))))
+            return
+        fanout = connection.execute(select([users.c.timeline_fanout]).where(users.c.id == followed_id)).scalar()
+        if not fanout:
+            return
+        author_posts = select([db.literal(follower_id), posts.c.id, posts.c.timestamp]).where(
+            posts.c.author_id == followed_id)
+        connection.execute(table.insert().from_select(TimelineEntry.columns, author_posts))
+
+    @staticmethod
+    def unfollow(connection, follower_id: int, followed_id: int):
+        table, posts = TimelineEntry.__table__, Post.__table__
+        connection.execute(table.delete().where(and_(
+            table.c.user_id == follower_id,
+            table.c.post_id.in_(select([posts.c.id]).where(posts.c.author_id == followed_id)))))
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Recompute which authors fan out and write all timelines again
+        :return: count of timeline entries
+        """
+        follower_counts = db.session.query(func.count(Follow.follower_id)).filter(
+            Follow.followed_id == User.id).scalar_subquery()
+        User.query.update({'timeline_fanout': follower_counts <= current_app.config['FLASKY_TIMELINE_FANOUT_LIMIT']},
+                          synchronize_session=False)
+        cls.query.delete(synchronize_session=False)
+        entries = db.session.query(Follow.follower_id, Post.id, Post.timestamp).join(
+            Post, Post.author_id == Follow.followed_id).join(User, User.id == Follow.followed_id).filter(
+            User.timeline_fanout.is_(True))
+        db.session.execute(cls.__table__.insert().from_select(cls.columns, entries))
+        db.session.commit()
+        return cls.query.count()
+
+
+db.event.listen(Follow, 'after_insert', Follow.on_inserted)
+db.event.listen(Follow, 'after_delete', Follow.on_deleted)
 
 
 class Images(db.Model):
     __tablename__ = 'images'
+    __table_args__ = (db.Index('ix_images_author_timestamp', 'author_id', 'timestamp'),)
     query: BaseQuery
 
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
-    filename = db.Column(db.String(128), unique=True, index=True)
+    filename = db.Column(db.String(128), index=True)  # blob filename, shared by equal images
+    blob_hash = db.Column(db.String(64), index=True)
+    width = db.Column(db.Integer)  # pixels of the original, None until renditions are made
 
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
     def __init__(self, filename: str, author: User):
+        """
+        :param filename: filename in the BlobStore
+        """
         self.filename = filename
+        self.blob_hash = BlobStore.blob_hash(filename)
+        self.author = author
+
+    @property
+    def path(self) -> str:
+        """Path relative to static folder"""
+        return BlobStore.relative_path(self.filename)
+
+    def renditions(self) -> List[Tuple[int, str]]:
+        """(width, path relative to static folder) of gallery renditions and the original, narrowest first"""
+        if not self.width:
+            return [(0, self.path)]
+        image_format = current_app.config['GALLERY_RENDITION_FORMAT']
+        return [(width, Renditions.relative_path(self.blob_hash, width, image_format))
+                for width in sorted(current_app.config['GALLERY_RENDITION_WIDTHS']) if width < self.width] + \
+            [(self.width, self.path)]
+
+    def to_json(self) -> dict:
+        json_image = {
+            'url': url_for('static', filename=self.path, _external=True),
+            'timestamp': self.timestamp,
+            'width': self.width,
+            'renditions': {width: url_for('static', filename=path, _external=True)
+                           for width, path in self.renditions()},
+            'author_url': url_for('api.get_user', user_id=self.author_id, _external=True)
+        }
+        return json_image
+
+    def make_renditions(self, renditions: Renditions):
+        self.width = renditions.generate(self.blob_hash, self.path)
+
+    @classmethod
+    def backfill_renditions(cls, renditions: Renditions) -> int:
+        """Make renditions of saved images, which do not have them
+        :return: count of processed blobs
+        """
+        filenames = [filename for filename, in
+                     db.session.query(cls.filename).filter(cls.width.is_(None)).distinct()]
+        for filename in filenames:
+            width = renditions.generate(BlobStore.blob_hash(filename), BlobStore.relative_path(filename))
+            cls.query.filter_by(filename=filename).update({'width': width}, synchronize_session=False)
+            db.session.commit()
+        return len(filenames)
+
+    @staticmethod
+    def references(filename: str, exclude_jobs: List[int] = ()) -> int:
+        """Count of saved images, transfer jobs and cached transfer results, which use the blob"""
+        path = BlobStore.relative_path(filename)
+        images = Images.query.filter_by(blob_hash=BlobStore.blob_hash(filename)).count()
+        jobs = TransferJob.query.filter((TransferJob.target_image == path) |
+                                        (TransferJob.style_reference_image == path) |
+                                        (TransferJob.result_image == path),
+                                        ~TransferJob.id.in_(exclude_jobs)).count()
+        results = TransferResult.query.filter_by(result_image=path).count()
+        return images + jobs + results
+
+    def delete(self, blob_store: BlobStore, renditions: Optional[Renditions] = None):
+        """Delete the saved image, the file and its renditions are removed with the last reference"""
+        db.session.delete(self)
+        db.session.commit()
+        if not self.references(self.filename):
+            blob_store.remove(self.filename)
+            if renditions:
+                renditions.remove(self.blob_hash)
+
+    @classmethod
+    def migrate_saves(cls, static_folder: str) -> int:
+        """Move images from per-user saves folders to the blob store
+        :return: count of moved files
+        """
+        blob_store = BlobStore(static_folder)
+        moved = 0
+        for path in glob(join(static_folder, 'images', '*', 'saves', '*')):
+            filename = basename(path)
+            author = User.query.filter_by(username=basename(dirname(dirname(path)))).first()
+            blob_filename = blob_store.put_file(path, move=True)
+            images = cls.query.filter_by(filename=filename).all()
+            if not images and author:
+                images = [cls(filename, author)]
+                db.session.add(images[0])
+            for image in images:
+                image.filename = blob_filename
+                image.blob_hash = BlobStore.blob_hash(blob_filename)
+            moved += 1
+        db.session.commit()
+        return moved
+
+
+class JobStatus:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    ACTIVE = (QUEUED, RUNNING)
+
+
+class TransferJob(db.Model):
+    __tablename__ = 'transfer_jobs'
+    query: BaseQuery
+
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(16), index=True, default=JobStatus.QUEUED)
+    # indexed for Images.references
+    target_image = db.Column(db.String(256), index=True)
+    style_reference_image = db.Column(db.String(256), index=True)
+    result_image = db.Column(db.String(256), index=True)
+    iterations = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(64))
+    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    started = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
+
+    iteration = db.Column(db.Integer)
+    loss = db.Column(db.Float)
+    eta = db.Column(db.Float)  # seconds
+    preview = db.deferred(db.Column(db.LargeBinary))  # downscaled JPEG of the last iteration
+    cache_key = db.Column(db.String(64), index=True)  # equal for jobs, which give the same result
+
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    artifacts = db.relationship('TransferArtifact', backref='job', lazy='dynamic', cascade='all, delete-orphan')
+
+    def __init__(self, author: User, target_image: str, style_reference_image: str, iterations: int):
         self.author = author
+        self.target_image = target_image
+        self.style_reference_image = style_reference_image
+        self.iterations = iterations
+        self.status = JobStatus.QUEUED
+        self.cache_key = TransferResult.make_key(target_image, style_reference_image, iterations)
+
+    @classmethod
+    def submit(cls, author: User, target_image: str, style_reference_image: str,
+               iterations: int) -> 'TransferJob':
+        """Put new job to the queue, or finish it at once with the cached result of the same inputs.
+        :raise JobRejected: queue is full or user has too many active jobs
+        """
+        cached = TransferResult.lookup(TransferResult.make_key(target_image, style_reference_image, iterations))
+        if cached:
+            job = cls(author, target_image, style_reference_image, iterations)
+            job.add_artifacts(ArtifactKind.UPLOAD, [target_image, style_reference_image])
+            db.session.add(job)
+            db.session.commit()
+            job.finish(cached.result_image)
+            return job
+
+        if cls.query.filter_by(status=JobStatus.QUEUED).count() >= current_app.config['TRANSFER_QUEUE_MAX_DEPTH']:
+            raise JobRejected('Style transfer queue is full. Try again later.')
+
+        active_jobs = author.transfer_jobs.filter(cls.status.in_(JobStatus.ACTIVE)).count()
+        if active_jobs >= current_app.config['TRANSFER_MAX_JOBS_PER_USER']:
+            raise JobRejected('You have too many style transfers in progress.')
+
+        job = cls(author, target_image, style_reference_image, iterations)
+        job.add_artifacts(ArtifactKind.UPLOAD, [target_image, style_reference_image])
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    @classmethod
+    def claimable(cls) -> BaseQuery:
+        """Queued jobs, which authors do not reach the running jobs limit.
+        Jobs equal to a running one wait for its result in the queue, so they take it from the cache.
+        """
+        busy_authors = db.session.query(cls.author_id).filter_by(status=JobStatus.RUNNING).group_by(
+            cls.author_id).having(func.count(cls.id) >= current_app.config['TRANSFER_MAX_RUNNING_PER_USER'])
+        running_keys = db.session.query(cls.cache_key).filter(cls.status == JobStatus.RUNNING,
+                                                              cls.cache_key.isnot(None))
+        return cls.query.filter(cls.status == JobStatus.QUEUED,
+                                ~cls.author_id.in_(busy_authors),
+                                or_(cls.cache_key.is_(None), ~cls.cache_key.in_(running_keys))
+                                ).order_by(cls.id.asc())
+
+    @classmethod
+    def _take(cls, job: 'TransferJob', worker: str) -> bool:
+        claimed = cls.query.filter_by(id=job.id, status=JobStatus.QUEUED).update(
+            {'status': JobStatus.RUNNING, 'worker': worker, 'started': datetime.utcnow()},
+            synchronize_session=False)
+        db.session.commit()
+        return bool(claimed)
+
+    @classmethod
+    def claim(cls, worker: str) -> Optional['TransferJob']:
+        """Take the oldest claimable job"""
+        job = cls.claimable().first()
+        return job if job and cls._take(job, worker) else None
+
+    @classmethod
+    def claim_batch(cls, worker: str, size: int,
+                    batch_key: Callable[['TransferJob'], Optional[Hashable]]) -> List['TransferJob']:
+        """Take the oldest claimable job and up to size - 1 claimable jobs with the same batch key,
+        other jobs stay queued for other workers
+        :param batch_key: jobs with equal keys run in one batch, None if the job can not share a batch
+        """
+        first = cls.claim(worker)
+        if not first:
+            return []
+        jobs = [first]
+        key = batch_key(first)
+        skipped = [first.id]
+        while key is not None and len(jobs) < size:
+            job = cls.claimable().filter(cls.iterations == first.iterations, ~cls.id.in_(skipped)).first()
+            if not job:
+                break
+            skipped.append(job.id)
+            if batch_key(job) == key and cls._take(job, worker):
+                jobs.append(job)
+        return jobs
+
+    @classmethod
+    def running_workers(cls) -> List[str]:
+        return [worker for worker, in db.session.query(cls.worker).filter_by(status=JobStatus.RUNNING).distinct()]
+
+    @classmethod
+    def requeue_stale(cls, workers: List[str]) -> int:
+        """Return running jobs of the stopped workers back to the queue.
+        :return: count of requeued jobs
+        """
+        if not workers:
+            return 0
+        requeued = cls.query.filter(cls.status == JobStatus.RUNNING, cls.worker.in_(workers)).update(
+            {'status': JobStatus.QUEUED, 'worker': None, 'started': None}, synchronize_session=False)
+        db.session.commit()
+        return requeued
+
+    @classmethod
+    def report_progress(cls, job_id: int, iteration: int, loss: float, eta: float, preview: bytes) -> bool:
+        """Store progress of the running job.
+        :return: False if job is not running anymore, e.g. it was cancelled
+        """
+        reported = cls.query.filter_by(id=job_id, status=JobStatus.RUNNING).update(
+            {'iteration': iteration, 'loss': loss, 'eta': eta, 'preview': preview}, synchronize_session=False)
+        db.session.commit()
+        return bool(reported)
+
+    @classmethod
+    def progress(cls, job_id: int) -> Optional[dict]:
+        """Fresh status and progress of the job, without loading the preview"""
+        columns = (cls.status, cls.iteration, cls.loss, cls.eta, cls.result_image, cls.error)
+        row = db.session.query(*columns).filter_by(id=job_id).first()
+        if row is None:
+            return None
+        progress = {column.key: value for column, value in zip(columns, row)}
+        if progress['loss'] is not None and not isfinite(progress['loss']):
+            progress['loss'] = None  # JSON has no NaN or Infinity
+        result_image = progress.pop('result_image')
+        progress['result'] = url_for('static', filename=result_image) if result_image else None
+        progress['preview'] = url_for('transfer.job_preview', job_id=job_id, iteration=progress['iteration']) \
+            if progress['iteration'] is not None else None
+        return progress
+
+    def _close(self, status: str, **fields) -> bool:
+        fields.update(status=status, finished=datetime.utcnow())
+        closed = TransferJob.query.filter(TransferJob.id == self.id,
+                                          TransferJob.status.in_(JobStatus.ACTIVE)).update(
+            fields, synchronize_session=False)
+        db.session.commit()
+        return bool(closed)
+
+    def add_artifacts(self, kind: str, paths: List[str]):
+        """Record files of the job in the manifest, paths are relative to static folder"""
+        for path in paths:
+            self.artifacts.append(TransferArtifact(kind=kind, path=path))
+
+    def finish(self, result_image: str) -> bool:
+        self.add_artifacts(ArtifactKind.RESULT, [result_image])
+        return self._close(JobStatus.DONE, result_image=result_image)
+
+    def fail(self, error: str) -> bool:
+        return self._close(JobStatus.FAILED, error=error)
+
+    def cancel(self) -> bool:
+        return self._close(JobStatus.CANCELLED)
+
+    @property
+    def position(self) -> int:
+        """Count of queued jobs ahead of this one"""
+        if self.status != JobStatus.QUEUED:
+            return 0
+        return TransferJob.query.filter(TransferJob.status == JobStatus.QUEUED, TransferJob.id < self.id).count()
+
+    def to_json(self) -> dict:
+        json_job = {
+            'id': self.id,
+            'status': self.status,
+            'position': self.position,
+            'timestamp': self.timestamp,
+            'started': self.started,
+            'finished': self.finished,
+            'error': self.error,
+            'iteration': self.iteration,
+            'iterations': self.iterations,
+            'loss': self.loss,
+            'eta': self.eta,
+            'url': url_for('transfer.job_status', job_id=self.id, _external=True),
+            'events': url_for('transfer.job_events', job_id=self.id, _external=True),
+            'result': url_for('static', filename=self.result_image) if self.result_image else None,
+            'preview': url_for('transfer.job_preview', job_id=self.id, iteration=self.iteration)
+            if self.iteration is not None else None
+        }
+        return json_job
+
+
+class ArtifactKind:
+    UPLOAD = 'upload'
+    SNAPSHOT = 'snapshot'
+    RESULT = 'result'
+
+
+class TransferArtifact(db.Model):
+    """Manifest of files written for transfer jobs"""
+    __tablename__ = 'transfer_artifacts'
+    query: BaseQuery
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16))
+    path = db.Column(db.String(256), index=True)  # relative to static folder
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    job_id = db.Column(db.Integer, db.ForeignKey('transfer_jobs.id'), index=True)
+
+    @classmethod
+    def collect_garbage(cls, static_folder: str, older_than: datetime) -> int:
+        """Remove files of jobs finished before older_than, buffer files, which are not in the manifest,
+        and blobs stored before older_than, which nothing references, e.g. uploads of rejected jobs.
+        Removed results are not available on the job page anymore, blobs used by saved images
+        or other jobs are kept.
+        :return: count of removed files
+        """
+        removed = 0
+        stale_jobs = TransferJob.query.filter(~TransferJob.status.in_(JobStatus.ACTIVE),
+                                              TransferJob.finished < older_than)
+        stale_job_ids = [job_id for job_id, in stale_jobs.with_entities(TransferJob.id)]
+        for artifact in cls.query.filter(cls.job_id.in_(stale_job_ids)):
+            path = join(static_folder, artifact.path)
+            in_use = BlobStore.is_blob(artifact.path) and \
+                Images.references(basename(artifact.path), exclude_jobs=stale_job_ids)
+            if exists(path) and not in_use:
+                remove(path)
+                removed += 1
+            db.session.delete(artifact)
+        stale_jobs.update({'result_image': None, 'preview': None}, synchronize_session=False)
+        db.session.commit()
+
+        known = {path for path, in db.session.query(cls.path)}
+        mtime_limit = older_than.replace(tzinfo=timezone.utc).timestamp()
+        for folder in ('buffer', 'model'):
+            for path in glob(join(static_folder, 'images', '*', folder, '*')):
+                if ImagesPath.convert(relpath(path, static_folder)) not in known and getmtime(path) < mtime_limit:
+                    remove(path)
+                    removed += 1
+        return removed + cls.collect_blobs(static_folder, mtime_limit)
+
+    @staticmethod
+    def collect_blobs(static_folder: str, mtime_limit: float) -> int:
+        """Remove blobs modified before mtime_limit, which no saved image, job or cached result uses
+        :return: count of removed files
+        """
+        used = {blob_hash for blob_hash, in db.session.query(Images.blob_hash).distinct()}
+        for column in (TransferJob.target_image, TransferJob.style_reference_image, TransferJob.result_image,
+                       TransferResult.result_image):
+            used.update(BlobStore.blob_hash(path) for path, in db.session.query(column).filter(
+                column.isnot(None)).distinct())
+        removed = 0
+        for path in glob(join(static_folder, BlobStore.root, *['*'] * (BlobStore.fan_out + 1))):
+            if BlobStore.blob_hash(path) not in used and getmtime(path) < mtime_limit:
+                remove(path)
+                removed += 1
+        return removed
+
+
+class TransferResult(db.Model):
+    """Results of finished jobs by the cache key of their inputs and transfer options.
+    Least recently used results are evicted, when files kept only by the cache exceed TRANSFER_RESULT_CACHE_SIZE bytes.
+    """
+    __tablename__ = 'transfer_results'
+    query: BaseQuery
+
+    key = db.Column(db.String(64), primary_key=True)
+    result_image = db.Column(db.String(256), index=True)  # blob path relative to static folder
+    size = db.Column(db.Integer)  # bytes
+    last_used = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+
+    @staticmethod
+    def make_key(target_image: str, style_reference_image: str, iterations: int) -> str:
+        """Hash of the input blobs and of everything in the config, which changes the result image.
+        Image size is given by the target content, loss weights by the style preset.
+        """
+        config = current_app.config
+        parameters = [BlobStore.blob_hash(target_image), BlobStore.blob_hash(style_reference_image), iterations]
+        parameters += [config[name] for name in (
+            'TRANSFER_PRECISION', 'TRANSFER_STYLE_PRESET', 'TRANSFER_PYRAMID_LEVELS', 'TRANSFER_OPTIMIZER',
+            'TRANSFER_OPTIMIZER_STEPS', 'TRANSFER_MAX_EVALUATIONS', 'TRANSFER_EARLY_STOPPING_PATIENCE',
+            'TRANSFER_EARLY_STOPPING_MIN_DELTA', 'TRANSFER_SNAPSHOT_FORMAT', 'TRANSFER_SNAPSHOT_QUALITY')]
+        return hashlib.sha256(json.dumps(parameters).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def lookup(cls, key: Optional[str]) -> Optional['TransferResult']:
+        """Cached result, which file still exists, it becomes the most recently used"""
+        if not key or not current_app.config['TRANSFER_RESULT_CACHE_SIZE']:
+            return None
+        result = cls.query.get(key)
+        if result is None:
+            return None
+        if not exists(join(current_app.static_folder, result.result_image)):
+            db.session.delete(result)
+            db.session.commit()
+            return None
+        result.last_used = datetime.utcnow()
+        db.session.commit()
+        return result
+
+    @classmethod
+    def store(cls, key: Optional[str], result_image: str):
+        """Cache the result image and evict old results over the size limit"""
+        if not key or not current_app.config['TRANSFER_RESULT_CACHE_SIZE']:
+            return
+        size = getsize(join(current_app.static_folder, result_image))
+        db.session.merge(cls(key=key, result_image=result_image, size=size, last_used=datetime.utcnow()))
+        try:
+            db.session.commit()
+        except IntegrityError:  # stored by another worker at the same time
+            db.session.rollback()
+        cls.evict(current_app.config['TRANSFER_RESULT_CACHE_SIZE'])
+
+    @classmethod
+    def evict(cls, max_size: int) -> int:
+        """Remove least recently used results, until files kept only by the cache fit into max_size bytes.
+        Results, which files are also used by jobs or saved images, would free no disk, so they are kept
+        and count once transfer-gc collects the jobs.
+        :return: count of evicted results
+        """
+        results = cls.query.order_by(cls.last_used.asc()).all()
+        cached = {}  # cached results by file
+        for result in results:
+            filename = basename(result.result_image)
+            cached[filename] = cached.get(filename, 0) + 1
+        # files used by jobs or saved images, one query per table for all cached files
+        paths = {result.result_image for result in results}
+        job_columns = (TransferJob.target_image, TransferJob.style_reference_image, TransferJob.result_image)
+        job_rows = db.session.query(*job_columns).filter(db.or_(*(column.in_(paths) for column in job_columns)))
+        used = {path for row in job_rows for path in row} & paths
+        saved = {blob_hash for blob_hash, in db.session.query(Images.blob_hash).filter(
+            Images.blob_hash.in_({BlobStore.blob_hash(path) for path in paths})).distinct()}
+        held = [result for result in results
+                if result.result_image not in used and BlobStore.blob_hash(result.result_image) not in saved]
+        total = sum({basename(result.result_image): result.size for result in held}.values())
+        evicted = 0
+        for result in held:
+            if total <= max_size:
+                break
+            filename, size = basename(result.result_image), result.size
+            db.session.delete(result)
+            db.session.commit()
+            cached[filename] -= 1
+            if not cached[filename]:
+                BlobStore(current_app.static_folder).remove(filename)
+                total -= size
+            evicted += 1
+        return evicted
@@ -0,0 +1,133 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from flask import request, url_for
+from sqlalchemy import and_, or_
+
+from .exceptions import InvalidCursor
+
+
+class KeysetPagination:
+    """Page of a query ordered by (timestamp, id), neighbour pages are addressed by opaque cursors.
+    Unlike offset pagination every page costs the same and no COUNT(*) is made.
+    """
+
+    def __init__(self, query, model, per_page: int, cursor: Optional[str] = None, descending: bool = True):
+        """
+        :param model: model of the query with timestamp and id columns
+        :param cursor: cursor of the page from next_cursor or prev_cursor, the first page by default
+        :param descending: newest first
+        """
+        self.per_page = per_page
+        self.descending = descending
+        self.query = query
+        self.sources = [(query, model.timestamp, model.id)]
+        self.load(cursor)
+
+    def load(self, cursor: Optional[str]):
+        """Read the page of every source and merge them"""
+        key, backward = self.decode(cursor) if cursor else (None, False)
+
+        # backward pages are read in the reverse order from the cursor and flipped
+        newest_first = self.descending != backward
+        items = []
+        for query, timestamp_column, id_column in self.sources:
+            if key:
+                timestamp, id_ = key
+                before = newest_first
+                timestamp_cmp = timestamp_column < timestamp if before else timestamp_column > timestamp
+                id_cmp = id_column < id_ if before else id_column > id_
+                # the redundant bound lets the timestamp index be searched as a range
+                timestamp_range = timestamp_column <= timestamp if before else timestamp_column >= timestamp
+                query = query.filter(timestamp_range, or_(timestamp_cmp, and_(timestamp_column == timestamp, id_cmp)))
+            if newest_first:
+                query = query.order_by(timestamp_column.desc(), id_column.desc())
+            else:
+                query = query.order_by(timestamp_column.asc(), id_column.asc())
+            items += query.limit(self.per_page + 1).all()
+        if len(self.sources) > 1:
+            items.sort(key=lambda item: (item.timestamp, item.id), reverse=newest_first)
+
+        more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if backward:
+            items.reverse()
+        self.items: List[Any] = items
+        self.has_next = more if not backward else key is not None
+        self.has_prev = more if backward else key is not None
+
+    @property
+    def total(self) -> int:
+        """Count of all items, it is a COUNT(*) query"""
+        return self.query.order_by(None).count()
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        return self.encode(self.items[-1], False) if self.has_next and self.items else None
+
+    @property
+    def prev_cursor(self) -> Optional[str]:
+        return self.encode(self.items[0], True) if self.has_prev and self.items else None
+
+    @staticmethod
+    def encode(item, backward: bool) -> str:
+        payload = [item.timestamp.isoformat(), item.id, int(backward)]
+        return urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode(cursor: str) -> Tuple[Tuple[datetime, int], bool]:
+        """
+        :return: (timestamp, id) of the item next to the page, is the page before the item
+        :raise InvalidCursor: cursor was not made by encode
+        """
+        try:
+            timestamp, id_, backward = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            return (datetime.fromisoformat(timestamp), int(id_)), bool(backward)
+        except (ValueError, TypeError) as err:
+            raise InvalidCursor('Invalid page cursor.') from err
+
+
+class MergedKeysetPagination(KeysetPagination):
+    """Keyset pagination of several queries of one model with disjoint results,
+    every query is paged by its own (timestamp, id) key columns, so it can use its own index.
+    """
+
+    def __init__(self, sources: List[Tuple[Any, Any, Any]], per_page: int, cursor: Optional[str] = None,
+                 descending: bool = True):
+        """
+        :param sources: (query, timestamp column, id column) of every query,
+                        the columns are equal to timestamp and id of the items
+        """
+        self.per_page = per_page
+        self.descending = descending
+        self.sources = sources
+        self.load(cursor)
+
+    @property
+    def total(self) -> int:
+        return sum(query.order_by(None).count() for query, _, _ in self.sources)
+
+
+def make_keyset_pagination(query, model, per_page: int, descending: bool = True) -> KeysetPagination:
+    """Keyset pagination of the page from the request's cursor argument"""
+    return KeysetPagination(query, model, per_page, request.args.get('cursor'), descending)
+
+
+def make_merged_keyset_pagination(sources: List[Tuple[Any, Any, Any]], per_page: int,
+                                  descending: bool = True) -> MergedKeysetPagination:
+    return MergedKeysetPagination(sources, per_page, request.args.get('cursor'), descending)
+
+
+def keyset_links(pagination: KeysetPagination, endpoint: str, **values) -> dict:
+    """prev and next links of an API collection page, with the total count if the request has count=1
+    :param values: arguments of the endpoint
+    """
+    links = {
+        'prev': url_for(endpoint, cursor=pagination.prev_cursor, **values) if pagination.prev_cursor else None,
+        'next': url_for(endpoint, cursor=pagination.next_cursor, **values) if pagination.next_cursor else None
+    }
+    if request.args.get('count', 0, type=int):
+        links['count'] = pagination.total
+    return links
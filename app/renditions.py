@@ -0,0 +1,65 @@
+from os import makedirs, replace, remove
+from os.path import join, exists, dirname
+from tempfile import NamedTemporaryFile
+from typing import Sequence
+
+from PIL import Image
+from flask import Flask
+
+from .blob_store import make_readable
+
+
+class Renditions:
+    """Downscaled copies of blob store images for the gallery.
+    Renditions are named by the blob hash, so changed content gets new renditions.
+    """
+    root = join('images', 'renditions')
+    FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+    def __init__(self, static_path: str, widths: Sequence[int], image_format: str = 'webp', quality: int = 80):
+        self.static_path = static_path
+        self.widths = sorted(widths)
+        self.image_format = image_format
+        self.quality = quality
+
+    @classmethod
+    def from_app(cls, app: Flask) -> 'Renditions':
+        return cls(app.static_folder,
+                   app.config['GALLERY_RENDITION_WIDTHS'],
+                   app.config['GALLERY_RENDITION_FORMAT'],
+                   app.config['GALLERY_RENDITION_QUALITY'])
+
+    @classmethod
+    def relative_path(cls, blob_hash: str, width: int, image_format: str) -> str:
+        extension = 'jpg' if image_format == 'jpeg' else image_format
+        return join(cls.root, blob_hash[:2], blob_hash[2:4], f'{blob_hash}_{width}.{extension}').replace('\\', '/')
+
+    def abs_path(self, path: str) -> str:
+        return join(self.static_path, path)
+
+    def generate(self, blob_hash: str, image_path: str) -> int:
+        """Make missing renditions narrower than the image
+        :param image_path: path of the original relative to static folder
+        :return: width of the original
+        """
+        with Image.open(self.abs_path(image_path)) as image:
+            for width in self.widths:
+                if width >= image.width:
+                    break
+                path = self.abs_path(self.relative_path(blob_hash, width, self.image_format))
+                if exists(path):
+                    continue
+                rendition = image.convert('RGB').resize((width, max(1, round(image.height * width / image.width))),
+                                                        Image.LANCZOS)
+                makedirs(dirname(path), exist_ok=True)
+                with NamedTemporaryFile(dir=dirname(path), suffix='.tmp', delete=False) as tmp:
+                    rendition.save(tmp, self.FORMATS[self.image_format], quality=self.quality)
+                make_readable(tmp.name)
+                replace(tmp.name, path)
+            return image.width
+
+    def remove(self, blob_hash: str):
+        for width in self.widths:
+            path = self.abs_path(self.relative_path(blob_hash, width, self.image_format))
+            if exists(path):
+                remove(path)
@@ -1,14 +1,18 @@
-from shutil import copyfile
+import json
+import time
+from os.path import basename
 from typing import List
-from uuid import uuid4
 
-from flask import render_template, flash, current_app, Flask, redirect, url_for
+from flask import render_template, flash, current_app, Flask, redirect, url_for, jsonify, abort, Response, \
+    stream_with_context
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
 
-from style_transfer import StyleTransfer
-from app.models import Images, User
-from app.images_path import ImagesPath
+from app.blob_store import BlobStore
+from app.exceptions import JobRejected, InvalidCursor
+from app.pagination import make_keyset_pagination
+from app.renditions import Renditions
+from app.upload_request import save_upload
+from app.models import Images, User, TransferJob, JobStatus
 from . import transfer
 from .forms import PhotoForm
 from app import db
@@ -17,72 +21,141 @@ current_user: User
 current_app: Flask
 
 
+def get_user_job(job_id: int) -> TransferJob:
+    job = TransferJob.query.get_or_404(job_id)
+    if job.author_id != current_user.id and not current_user.is_admin():
+        abort(403)
+    return job
+
+
 @transfer.route('/style_transfer', methods=['GET', 'POST'])
 @login_required
 def style_transfer():
     form = PhotoForm()
 
     if form.validate_on_submit():
-        username = current_user.username
-        image_path = ImagesPath(username, current_app.static_folder)
-
-        target_image = form.target_image.data
-        style_reference_image = form.style_reference_image.data
+        blob_store = BlobStore(current_app.static_folder)
+
+        target_image_path = save_upload(blob_store, form.target_image.data)
+        style_reference_image_path = save_upload(blob_store, form.style_reference_image.data)
+
+        try:
+            job = TransferJob.submit(current_user._get_current_object(),
+                                     target_image_path,
+                                     style_reference_image_path,
+                                     iterations=current_app.config['MODEL_ITERATION'])
+        except JobRejected as err:  # unreferenced uploads are removed by transfer-gc
+            flash(err.args[0])
+            return render_template('transfer/image_transfer.html', form=form)
+
+        flash('Result image is ready.' if job.status == JobStatus.DONE else 'Wait for result image.')
+        return redirect(url_for('.job_page', job_id=job.id))
+    return render_template('transfer/image_transfer.html', form=form)
 
-        target_image_name = secure_filename(target_image.filename)
-        style_reference_image_name = secure_filename(style_reference_image.filename)
 
-        target_image_path = image_path.buffer_image_path(target_image_name)
-        style_reference_image_path = image_path.buffer_image_path(style_reference_image_name)
+@transfer.route('/jobs/<int:job_id>')
+@login_required
+def job_page(job_id: int):
+    job = get_user_job(job_id)
+    return render_template('transfer/image_transfer.html', form=PhotoForm(), job=job)
 
-        target_image_path_abs = image_path.abs_path(target_image_path)
-        style_reference_image_path_abs = image_path.abs_path(style_reference_image_path)
 
-        target_image.save(target_image_path_abs)
-        style_reference_image.save(style_reference_image_path_abs)
+@transfer.route('/jobs/<int:job_id>/status')
+@login_required
+def job_status(job_id: int):
+    return jsonify(get_user_job(job_id).to_json())
 
-        flash('Wait for result image.')
 
-        StyleTransfer(target_image_path_abs,
-                      style_reference_image_path_abs,
-                      save_path=image_path.model_buffer(absolute=True),
-                      iterations=current_app.config['MODEL_ITERATION']).transfer()
+@transfer.route('/jobs/<int:job_id>/events')
+@login_required
+def job_events(job_id: int):
+    """Server-Sent Events stream of the job progress, ends when the job is finished.
+    A stream holds the worker of the request, so it is short and the browser reconnects after the retry hint.
+    """
+    get_user_job(job_id)
+    poll_interval = current_app.config['TRANSFER_STATUS_POLL_INTERVAL']
+    timeout = current_app.config['TRANSFER_EVENTS_TIMEOUT']
+
+    def events():
+        yield f'retry: {poll_interval}\n\n'
+        last_progress = None
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            progress = TransferJob.progress(job_id)
+            db.session.rollback()  # end the transaction, so the next poll sees new progress
+            if progress is None:  # the job is deleted
+                yield 'event: end\ndata: {}\n\n'
+                return
+            if progress != last_progress:
+                yield f'event: progress\ndata: {json.dumps(progress)}\n\n'
+                last_progress = progress
+            else:
+                yield ': keep-alive\n\n'
+            if progress['status'] not in JobStatus.ACTIVE:
+                yield 'event: end\ndata: {}\n\n'
+                return
+            time.sleep(poll_interval / 1000)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@transfer.route('/jobs/<int:job_id>/preview')
+@login_required
+def job_preview(job_id: int):
+    job = get_user_job(job_id)
+    if not job.preview:
+        abort(404)
+    return Response(job.preview, mimetype='image/jpeg', headers={'Cache-Control': 'no-cache'})
 
-        result_image_path = image_path.last_file_path()
 
-        return render_template('transfer/image_transfer.html',
-                               target_image_path=image_path.convert(target_image_path),
-                               style_reference_image_path=image_path.convert(style_reference_image_path),
-                               form=form,
-                               result_image_path=image_path.convert(result_image_path),
-                               username=username)
-    return render_template('transfer/image_transfer.html', form=form)
+@transfer.route('/jobs/<int:job_id>/result')
+@login_required
+def job_result(job_id: int):
+    job = get_user_job(job_id)
+    if not job.result_image:
+        abort(404)
+    return redirect(url_for('static', filename=job.result_image))
 
 
-@transfer.route('/save_image/<username>')
+@transfer.route('/jobs/<int:job_id>/cancel', methods=['POST'])
 @login_required
-def save_image(username):
-    image_path = ImagesPath(username, current_app.static_folder)
+def cancel_job(job_id: int):
+    if not current_app.config['TRANSFER_JOB_CANCELLATION']:
+        abort(403)
+    job = get_user_job(job_id)
+    if job.cancel():
+        flash('Style transfer has been cancelled.')
+    return redirect(url_for('.job_page', job_id=job_id))
 
-    src = image_path.last_file_path(absolute=True)
-    filename = f'{uuid4().hex}.jpg'
-    dst = image_path.save_image_path(filename, absolute=True)
-    copyfile(src, dst)
 
-    user = User.get_user_by_name(username)
-    img = Images(filename=filename, author=user)
+@transfer.route('/jobs/<int:job_id>/save')
+@login_required
+def save_image(job_id: int):
+    """Add the result of the job to the author's gallery, the result file is shared, only renditions are made"""
+    job = get_user_job(job_id)
+    if not job.result_image:
+        abort(404)
+
+    if BlobStore.is_blob(job.result_image):
+        filename = basename(job.result_image)
+    else:
+        blob_store = BlobStore(current_app.static_folder)
+        filename = blob_store.put_file(blob_store.abs_path(job.result_image))
+
+    img = Images(filename=filename, author=job.author)
+    img.make_renditions(Renditions.from_app(current_app))
     db.session.add(img)
     db.session.commit()
 
-    return redirect(url_for('.style_transfer'))
+    return redirect(url_for('.job_page', job_id=job_id))
 
 
 @transfer.route('/gallery/<username>')
 def gallery(username):
-    img_path = ImagesPath(username, current_app.static_folder)
-    images_names = img_path.get_save_images_name()
-    images_relative_path = [
-        img_path.convert(img_path.save_image_path(filename=images_name))
-        for images_name in images_names
-    ]
-    return render_template('transfer/gallery.html', images_relative_path=images_relative_path)
+    user = User.get_user_by_name(username, rise_404=True)
+    try:
+        pagination = make_keyset_pagination(user.images, Images, current_app.config['FLASKY_IMAGES_PER_PAGE'])
+    except InvalidCursor:
+        abort(400)
+    return render_template('transfer/gallery.html', images=pagination.items, pagination=pagination, username=username)
@@ -0,0 +1,246 @@
+import os
+import signal
+import time
+from io import BytesIO
+from multiprocessing import Process
+from os.path import basename
+from typing import Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+from flask import Flask, current_app
+
+from app import create_app, db
+from app.blob_store import BlobStore
+from app.exceptions import JobCancelled
+from app.images_path import ImagesPath
+from app.models import TransferJob, ArtifactKind, TransferResult
+
+
+def close_job(app: Flask, job: TransferJob, image_path: ImagesPath, result: Union[str, Exception],
+              written: List[str] = ()):
+    """Store the error of the finished transfer, or move the result image to the blob store
+    :param written: files written by the transfer, result included
+    """
+    job.add_artifacts(ArtifactKind.SNAPSHOT, [image_path.convert(image_path.model_buffer(basename(path)))
+                                              for path in written if path != result])
+    if isinstance(result, JobCancelled):
+        app.logger.info(result.args[0])
+        db.session.commit()
+    elif isinstance(result, Exception):
+        app.logger.error(f'Job {job.id} failed: {result!r}')
+        job.fail(str(result))
+    else:
+        blob_store = BlobStore(app.static_folder)
+        result_image = blob_store.relative_path(blob_store.put_file(result, move=True))
+        job.finish(result_image)
+        TransferResult.store(job.cache_key, result_image)
+
+
+def make_preview(image, size: int, quality: int) -> bytes:
+    """Downscaled JPEG of the current transfer image"""
+    preview = Image.fromarray(image)
+    preview.thumbnail((size, size))
+    buffer = BytesIO()
+    preview.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def progress_reporter(app: Flask, job_id: int, total_iterations: int):
+    """Callback, which stores progress of the job and stops the transfer if the job is not running anymore"""
+    start_time = time.time()
+
+    def report_progress(iteration: int, loss_value: float, image):
+        eta = (time.time() - start_time) / (iteration + 1) * max(total_iterations - iteration - 1, 0)
+        preview = make_preview(image, app.config['TRANSFER_PREVIEW_SIZE'], app.config['TRANSFER_PREVIEW_QUALITY'])
+        if not TransferJob.report_progress(job_id, iteration, loss_value, eta, preview):
+            raise JobCancelled(f'Job {job_id} cancelled at iteration {iteration}.')
+    return report_progress
+
+
+def transfer_options(app: Flask, feature_cache) -> dict:
+    """Options of the style transfer engine from the app config"""
+    from style_transfer import EarlyStopping, SnapshotPolicy, get_model_service
+
+    patience = app.config['TRANSFER_EARLY_STOPPING_PATIENCE']
+    return {
+        'service': get_model_service(app.config['TRANSFER_PRECISION'], app.config['TRANSFER_STYLE_PRESET']),
+        'feature_cache': feature_cache,
+        'levels': app.config['TRANSFER_PYRAMID_LEVELS'],
+        'optimizer': app.config['TRANSFER_OPTIMIZER'],
+        'steps': app.config['TRANSFER_OPTIMIZER_STEPS'],
+        'max_evaluations': app.config['TRANSFER_MAX_EVALUATIONS'],
+        'early_stopping': EarlyStopping(patience, app.config['TRANSFER_EARLY_STOPPING_MIN_DELTA']) if patience else None,
+        'snapshots': SnapshotPolicy(app.config['TRANSFER_SNAPSHOT_MODE'],
+                                    every=app.config['TRANSFER_SNAPSHOT_EVERY'],
+                                    image_format=app.config['TRANSFER_SNAPSHOT_FORMAT'],
+                                    quality=app.config['TRANSFER_SNAPSHOT_QUALITY'])
+    }
+
+
+def run_batch(app: Flask, jobs: List[TransferJob], img_size: Tuple[int, int], feature_cache):
+    """Run jobs with the same image size and iterations in one batch"""
+    from style_transfer import BatchStyleTransfer
+
+    image_paths = [ImagesPath(job.author.username, app.static_folder) for job in jobs]
+    img_height, img_width = img_size
+    style_transfer = None
+    try:
+        style_transfer = BatchStyleTransfer(
+            [(image_path.abs_path(job.target_image), image_path.abs_path(job.style_reference_image))
+             for job, image_path in zip(jobs, image_paths)],
+            save_paths=[image_path.make_dir(image_path.model_buffer()) for image_path in image_paths],
+            iterations=jobs[0].iterations,
+            prefixes=[f'job_{job.id}' for job in jobs],
+            img_height=img_height,
+            img_width=img_width,
+            **transfer_options(app, feature_cache)
+        )
+        reporters = [progress_reporter(app, job.id, style_transfer.total_iterations) for job in jobs]
+        results = style_transfer.transfer(
+            callback=lambda index, iteration, loss_value, image: reporters[index](iteration, loss_value, image))
+    except Exception as err:
+        results = [err] * len(jobs)
+
+    written = style_transfer.written if style_transfer else [()] * len(jobs)
+    for job, image_path, result, job_written in zip(jobs, image_paths, results, written):
+        close_job(app, job, image_path, result, job_written)
+
+
+def batch_key(app: Flask):
+    """Key of jobs, which can run in one batch: image size and iterations"""
+    from style_transfer import BatchStyleTransfer
+
+    def key(job: TransferJob) -> Optional[Tuple[int, int, int]]:
+        image_path = ImagesPath(job.author.username, app.static_folder)
+        try:
+            return BatchStyleTransfer.image_size(image_path.abs_path(job.target_image)) + (job.iterations,)
+        except Exception:
+            return None  # run_jobs fails the job
+    return key
+
+
+def run_jobs(app: Flask, jobs: List[TransferJob], feature_cache):
+    """Finish jobs with cached results, group the rest by image size and iterations and run every group
+    as a batch, single jobs too, so the result size is given by the target only, not by batching
+    """
+    from style_transfer import BatchStyleTransfer
+
+    groups: Dict[Tuple[int, int, int], List[TransferJob]] = {}
+    for job in jobs:
+        cached = TransferResult.lookup(job.cache_key)
+        if cached:  # an equal job finished while this one was queued
+            job.finish(cached.result_image)
+            continue
+        image_path = ImagesPath(job.author.username, app.static_folder)
+        try:
+            img_size = BatchStyleTransfer.image_size(image_path.abs_path(job.target_image))
+        except Exception as err:
+            close_job(app, job, image_path, err)
+            continue
+        groups.setdefault(img_size + (job.iterations,), []).append(job)
+
+    for (img_height, img_width, _), group in groups.items():
+        run_batch(app, group, (img_height, img_width), feature_cache)
+
+
+def worker_name(pid: int) -> str:
+    return f'{os.uname().nodename}:{pid}'
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # process of another user
+        return True
+    return True
+
+
+def fail_jobs(app: Flask, jobs: List[TransferJob], err: Exception):
+    """Close jobs of the batch, which failed outside of the transfer, the process keeps working"""
+    app.logger.exception(f'Jobs {", ".join(str(job.id) for job in jobs)} failed: {err!r}')
+    db.session.rollback()
+    for job in jobs:
+        job.fail(str(err))
+
+
+def work(config_name: str):
+    """Worker process loop: take jobs from the queue and run them."""
+    from style_transfer import get_model_service, FeatureCache
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    app = create_app(config_name)
+    get_model_service(app.config['TRANSFER_PRECISION'], app.config['TRANSFER_STYLE_PRESET'])
+    feature_cache = FeatureCache(app.config['TRANSFER_FEATURE_CACHE_DIR'], app.config['TRANSFER_FEATURE_CACHE_SIZE'],
+                                 app.config['TRANSFER_FEATURE_CACHE_DISK_SIZE'])
+    worker = worker_name(os.getpid())
+    with app.app_context():
+        poll_interval = app.config['TRANSFER_WORKER_POLL_INTERVAL']
+        batch_size = app.config['TRANSFER_BATCH_SIZE']
+        job_key = batch_key(app)
+        while True:
+            jobs = TransferJob.claim_batch(worker, batch_size, job_key)
+            if jobs:
+                app.logger.info(f'Worker {worker} took jobs {", ".join(str(job.id) for job in jobs)}.')
+                try:
+                    run_jobs(app, jobs, feature_cache)
+                except Exception as err:
+                    fail_jobs(app, jobs, err)
+            else:
+                time.sleep(poll_interval)
+
+
+class WorkerPool:
+
+    def __init__(self, config_name: str, processes: int):
+        self.config_name = config_name
+        self.processes = processes
+        self.workers: List[Process] = []
+
+    def start(self):
+        for _ in range(self.processes):
+            worker = Process(target=work, args=(self.config_name,), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    @staticmethod
+    def requeue_stale() -> int:
+        """Return jobs of the dead worker processes of this host back to the queue,
+        jobs of other hosts and of running processes are left alone.
+        :return: count of requeued jobs
+        """
+        node = os.uname().nodename
+        stale = []
+        for worker in TransferJob.running_workers():
+            worker_node, _, pid = worker.rpartition(':')
+            if worker_node == node and pid.isdigit() and not is_alive(int(pid)):
+                stale.append(worker)
+        return TransferJob.requeue_stale(stale)
+
+    def run(self):
+        """Start workers and restart them if they die, until KeyboardInterrupt.
+        Jobs claimed by a dead worker are returned to the queue.
+        """
+        self.start()
+        try:
+            while True:
+                for index, worker in enumerate(self.workers):
+                    worker.join(1)
+                    if not worker.is_alive():
+                        requeued = TransferJob.requeue_stale([worker_name(worker.pid)])
+                        current_app.logger.warning(f'Worker {worker.pid} died with exit code {worker.exitcode}, '
+                                                   f'{requeued} jobs requeued.')
+                        self.workers[index] = Process(target=work, args=(self.config_name,), daemon=True)
+                        self.workers[index].start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
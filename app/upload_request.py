@@ -0,0 +1,88 @@
+from os import makedirs
+from os.path import join, splitext
+from tempfile import NamedTemporaryFile
+from typing import Optional
+
+from flask import Request, current_app, abort
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from .blob_store import BlobStore
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+IMAGE_EXTENSIONS = {'png': '.png', 'jpeg': '.jpg', 'gif': '.gif', 'bmp': '.bmp', 'webp': '.webp'}
+
+
+def sniff_image(header: bytes) -> Optional[str]:
+    """Image type by the leading bytes of the file"""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    for signature, image_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_type
+    return None
+
+
+class SpoolFile:
+    """Uploaded file written straight to disk while it is received.
+    Upload is rejected as soon as it exceeds max_size or its first bytes are not an image.
+    """
+    header_size = 12
+
+    def __init__(self, spool_dir: str, max_size: Optional[int]):
+        self.file = NamedTemporaryFile(dir=spool_dir, suffix='.upload')
+        self.max_size = max_size
+        self.size = 0
+        self.header = b''
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            self.file.close()
+            raise RequestEntityTooLarge()
+        if len(self.header) < self.header_size:
+            self.header += data[:self.header_size - len(self.header)]
+            if len(self.header) >= self.header_size and not self.image_type:
+                self.file.close()
+                raise UnsupportedMediaType('Only PNG, JPEG, GIF, BMP and WebP images can be uploaded.')
+        return self.file.write(data)
+
+    @property
+    def image_type(self) -> Optional[str]:
+        return sniff_image(self.header)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class UploadRequest(Request):
+    """Request with per-endpoint body limits from UPLOAD_LIMITS, files are spooled under the static folder"""
+
+    @property
+    def max_content_length(self) -> Optional[int]:
+        if current_app:
+            return current_app.config['UPLOAD_LIMITS'].get(self.endpoint, current_app.config['MAX_CONTENT_LENGTH'])
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool_dir = join(current_app.static_folder, current_app.config['UPLOAD_SPOOL_DIR'])
+        makedirs(spool_dir, exist_ok=True)
+        return SpoolFile(spool_dir, self.max_content_length)
+
+
+def save_upload(blob_store: BlobStore, file: FileStorage) -> str:
+    """Save uploaded file to the blob store, spooled files are linked without copying
+    :return: path relative to static folder
+    """
+    if not isinstance(file.stream, SpoolFile):
+        return blob_store.relative_path(blob_store.put_stream(file.stream, splitext(file.filename)[1]))
+    if not file.stream.image_type:
+        abort(415)
+    file.stream.flush()
+    return blob_store.relative_path(
+        blob_store.put_file(file.stream.name, extension=IMAGE_EXTENSIONS[file.stream.image_type]))
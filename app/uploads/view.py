@@ -1,11 +1,10 @@
-import os
-
-from flask import Flask, render_template
+from flask import Flask, render_template, current_app
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileRequired
-from werkzeug.utils import secure_filename
 
+from app.blob_store import BlobStore
 from app.blog_form import BlogFields
+from app.upload_request import save_upload
 from . import uploads
 
 current_app: Flask
@@ -20,9 +19,6 @@ class PhotoForm(FlaskForm):
 def upload():
     form = PhotoForm()
     if form.validate_on_submit():
-        f = form.photo.data
-        filename = secure_filename(f.filename)
-        filepath = os.path.join('images', filename)
-        f.save(filepath)
-        return render_template('upload/upload.html', filename=filename)
+        path = save_upload(BlobStore(current_app.static_folder), form.photo.data)
+        return render_template('upload/upload.html', path=path)
     return render_template('upload/upload.html', form=form)
@@ -2,7 +2,7 @@ from typing import Any, Tuple
 
 from flask import current_app, Flask, request
 from flask_sqlalchemy import Pagination
-
+from sqlalchemy.orm import joinedload
 
 from app.models import Post, Comment
 
@@ -10,12 +10,13 @@ current_app: Flask
 
 
 def make_post_pagination(pageable) -> Tuple[Pagination, Any]:
-    """ Make pagination for Post
+    """ Make pagination for Post, authors are loaded for the whole page
     :param pageable: Object, that have method order_by from sqlalchemy
     :return: pagination, pagination's items: posts
     """
     page = request.args.get('page', 1, type=int)
-    posts_pagination: Pagination = pageable.order_by(Post.timestamp.desc()).paginate(
+    query = pageable.options(joinedload(Post.author)).order_by(Post.timestamp.desc())
+    posts_pagination: Pagination = query.paginate(
         page,
         per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
         error_out=False)
@@ -30,7 +31,8 @@ def make_comments_pagination(post: Post) -> Tuple[Pagination, Any]:
     page = request.args.get('page', 1, type=int)
     if page == -1:
         page = (post.comments.count() - 1) / (current_app.config['FLASKY_COMMENTS_PER_PAGE'] + 1)
-    comments_pagination: Pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(
+    comments_pagination: Pagination = post.comments.options(joinedload(Comment.author)).order_by(
+        Comment.timestamp.asc()).paginate(
         page,
         per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
         error_out=False)
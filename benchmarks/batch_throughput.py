@@ -0,0 +1,39 @@
+"""Measure style transfer throughput (images per minute) for different batch sizes.
+
+Usage: python -m benchmarks.batch_throughput TARGET_IMAGE STYLE_IMAGE [--batch-sizes 1 2 4 8] [--iterations 2]
+"""
+import argparse
+import time
+from tempfile import TemporaryDirectory
+
+from style_transfer import BatchStyleTransfer, FeatureCache, get_model_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('target_image')
+    parser.add_argument('style_image')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--iterations', type=int, default=2)
+    args = parser.parse_args()
+
+    service = get_model_service()
+    with TemporaryDirectory() as save_path:
+        def run(batch_size: int):
+            # a fresh cache, so every batch size pays for decoding and features of its inputs
+            BatchStyleTransfer([(args.target_image, args.style_image)] * batch_size,
+                               save_paths=[save_path] * batch_size,
+                               iterations=args.iterations,
+                               service=service,
+                               feature_cache=FeatureCache()).transfer()
+
+        run(1)  # warm-up: the first session runs pay for memory allocation and kernel selection
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            run(batch_size)
+            elapsed = time.perf_counter() - start
+            print(f'batch size {batch_size}: {elapsed:.2f}s, {batch_size * 60 / elapsed:.2f} images/minute')
+
+
+if __name__ == '__main__':
+    main()
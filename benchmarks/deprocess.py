@@ -0,0 +1,51 @@
+"""Compare the copying deprocess_image path against deprocess_into reusable buffers.
+
+Usage: python -m benchmarks.deprocess [--heights 400 1024] [--repeat 20]
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable, Tuple
+
+import numpy as np
+
+from style_transfer.process_image import ProcessImage
+
+
+def measure(convert: Callable, repeat: int) -> Tuple[float, int]:
+    """Mean seconds and peak of allocated bytes of one conversion"""
+    convert()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        convert()
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    convert()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--heights', type=int, nargs='+', default=[400, 1024])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    for img_height in args.heights:
+        img_width = img_height * 3 // 2
+        x = np.random.uniform(-150, 150, (1, img_height * img_width * 3))
+        out = np.empty((img_height, img_width, 3), dtype='uint8')
+        scratch = np.empty((img_height, img_width, 3), dtype='float32')
+        candidates = (
+            ('copying', lambda: ProcessImage.deprocess_image(x[0].reshape((img_height, img_width, 3)).copy())),
+            ('buffered', lambda: ProcessImage.deprocess_into(x[0], out, scratch)),
+        )
+        for name, convert in candidates:
+            elapsed, peak = measure(convert, args.repeat)
+            print(f'{name} {img_height}x{img_width}: {elapsed * 1000:.2f} ms, {peak / 2 ** 20:.1f} MiB allocated')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Compare memory allocated on the Python side by one loss evaluation: the former copying path against Evaluator.
+
+Usage: python -m benchmarks.evaluator_memory [--height 400] [--width 600] [--evaluations 5]
+"""
+import argparse
+import tracemalloc
+from typing import Callable, List
+
+import numpy as np
+
+from style_transfer import get_model_service
+from style_transfer.evaluator import Evaluator
+
+
+def copying_evaluation(fetch_loss_and_grads, features: List['np.ndarray'], img_height: int, img_width: int):
+    """Evaluation as it was done before the buffers: features are indexed and outputs are cast on every call"""
+    def evaluate(x: 'np.ndarray'):
+        inputs = [x.reshape((1, img_height, img_width, 3))] + [layer_features[[0]] for layer_features in features]
+        losses, grads = fetch_loss_and_grads(inputs)
+        return losses.astype('float64'), grads.reshape((1, -1)).astype('float64')
+    return evaluate
+
+
+def profile(evaluate: Callable, x: 'np.ndarray', evaluations: int) -> List[int]:
+    """Peak of memory allocated during every evaluation, in bytes"""
+    evaluate(x)
+    peaks = []
+    tracemalloc.start()
+    for _ in range(evaluations):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        evaluate(x)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--height', type=int, default=400)
+    parser.add_argument('--width', type=int, default=600)
+    parser.add_argument('--evaluations', type=int, default=5)
+    args = parser.parse_args()
+
+    service = get_model_service()
+    image = np.random.uniform(-100, 100, (args.height, args.width, 3)).astype('float32')
+    features = service.content_features(image[None]) + service.style_grams(image[None])
+    x = image.reshape((1, -1)).astype('float64')
+
+    evaluator = Evaluator(service.fetch_loss_and_grads, {0: features}, args.height, args.width)
+    stacked = [np.stack([layer_features]) for layer_features in features]
+    candidates = (
+        ('copying', copying_evaluation(service.fetch_loss_and_grads, stacked, args.height, args.width)),
+        ('buffered', lambda x: evaluator(x, [0])),
+    )
+    for name, evaluate in candidates:
+        peaks = profile(evaluate, x, args.evaluations)
+        formatted = ', '.join(f'{peak / 2 ** 20:.1f}' for peak in peaks)
+        print(f'{name} {args.height}x{args.width}: mean {np.mean(peaks) / 2 ** 20:.1f} MiB per evaluation ({formatted})')
+
+
+if __name__ == '__main__':
+    main()
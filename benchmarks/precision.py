@@ -0,0 +1,69 @@
+"""Compare speed and quality of style transfer with the float32 and float16 model.
+
+Usage: python -m benchmarks.precision TARGET_IMAGE STYLE_IMAGE [TARGET_IMAGE STYLE_IMAGE ...] [--iterations 5]
+"""
+import argparse
+import time
+from tempfile import TemporaryDirectory
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from style_transfer import BatchStyleTransfer, FeatureCache, ModelService, SnapshotPolicy
+from style_transfer.process_image import ProcessImage
+
+
+def run(pairs: List[Tuple[str, str]], service: 'ModelService', iterations: int) -> Tuple[float, list]:
+    """Seconds and result image of every pair"""
+    images = []
+    with TemporaryDirectory() as save_path:
+        start = time.perf_counter()
+        for pair in pairs:
+            # every pair separately, so images of any size are compared at their own size
+            images += BatchStyleTransfer([pair], save_paths=[save_path], iterations=iterations, service=service,
+                                         feature_cache=FeatureCache(),
+                                         snapshots=SnapshotPolicy(SnapshotPolicy.MEMORY)).transfer()
+        elapsed = time.perf_counter() - start
+    return elapsed, images
+
+
+def score(service: 'ModelService', pair: Tuple[str, str], image: 'np.ndarray') -> float:
+    """Loss of the result image by the given service, so results of every precision are scored alike"""
+    target_image_path, style_reference_image_path = pair
+    process_image = ProcessImage(*image.shape[:2])
+    features = (service.content_features(process_image.preprocess_image(target_image_path))
+                + service.style_grams(process_image.preprocess_image(style_reference_image_path)))
+    losses, _ = service.fetch_loss_and_grads([process_image.preprocess(Image.fromarray(image))]
+                                             + [np.expand_dims(feature, 0) for feature in features])
+    return float(losses[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('images', nargs='+', help='pairs of target and style images')
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+    if len(args.images) % 2:
+        parser.error('images must be pairs of target and style images')
+    pairs = list(zip(args.images[::2], args.images[1::2]))
+
+    # the float32 service runs the reference transfer and scores the results of all precisions
+    reference = ModelService('float32')
+    base_time, base_images = run(pairs, reference, args.iterations)
+    base_losses = [score(reference, pair, image) for pair, image in zip(pairs, base_images)]
+    print(f'float32: {base_time:.2f}s')
+    for precision in ModelService.PRECISIONS[1:]:
+        elapsed, images = run(pairs, ModelService(precision), args.iterations)
+        losses = [score(reference, pair, image) for pair, image in zip(pairs, images)]
+        print(f'{precision}: {elapsed:.2f}s, speedup {base_time / elapsed:.2f}x')
+        for (target, style), base_loss, loss, base_image, image in zip(pairs, base_losses, losses,
+                                                                       base_images, images):
+            difference = np.abs(base_image.astype('int16') - image.astype('int16'))
+            print(f'  {target} + {style}: float32 loss {loss:.4g} vs {base_loss:.4g} '
+                  f'({(loss - base_loss) / base_loss:+.2%}), '
+                  f'pixel difference mean {difference.mean():.2f}, max {difference.max()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Measure time per megapixel and peak memory of tiled style transfer for different result heights.
+
+Usage: python -m benchmarks.tiled TARGET_IMAGE STYLE_IMAGE [--heights 1024 2048] [--tile-size 512]
+       [--memory-budget 2048] [--iterations 2]
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import TemporaryDirectory
+from typing import Optional
+
+from style_transfer import TiledStyleTransfer
+
+
+def run(target_image: str, style_image: str, img_height: int, tile_size: int, memory_budget: Optional[int],
+        iterations: int) -> dict:
+    with TemporaryDirectory() as save_path:
+        style_transfer = TiledStyleTransfer(target_image, style_image, save_path, iterations=iterations,
+                                            img_height=img_height, tile_size=tile_size, memory_budget=memory_budget)
+        style_transfer.transfer()
+    statistics = style_transfer.statistics()
+    statistics['size'] = (style_transfer.img_height, style_transfer.img_width)
+    return statistics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('target_image')
+    parser.add_argument('style_image')
+    parser.add_argument('--heights', type=int, nargs='+', default=[1024, 2048])
+    parser.add_argument('--tile-size', type=int, default=512)
+    parser.add_argument('--memory-budget', type=int, default=None, help='MiB of model memory')
+    parser.add_argument('--iterations', type=int, default=2)
+    args = parser.parse_args()
+    memory_budget = args.memory_budget * 2 ** 20 if args.memory_budget else None
+
+    for img_height in args.heights:
+        # every size in a fresh process, so the peak RSS is its own
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            statistics = executor.submit(run, args.target_image, args.style_image, img_height, args.tile_size,
+                                         memory_budget, args.iterations).result()
+        img_height, img_width = statistics['size']
+        print(f'{img_height}x{img_width}: {statistics["tiles"]} tiles of {statistics["tile_size"]}, '
+              f'{statistics["tiles_per_batch"]} per batch, {statistics["seconds_per_megapixel"]:.1f}s per megapixel, '
+              f'peak RSS {statistics["peak_rss"] / 2 ** 20:.0f} MiB')
+
+
+if __name__ == '__main__':
+    main()
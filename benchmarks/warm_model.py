@@ -0,0 +1,49 @@
+"""Compare per-job latency of style transfer with a cold and a warm model service.
+
+Usage: python -m benchmarks.warm_model TARGET_IMAGE STYLE_IMAGE [--jobs 3] [--iterations 1]
+"""
+import argparse
+import time
+from statistics import mean
+from tempfile import TemporaryDirectory
+from typing import List
+
+from keras import backend
+
+from style_transfer import StyleTransfer, ModelService, FeatureCache
+
+
+def run_jobs(target_image: str, style_image: str, jobs: int, iterations: int, warm: bool) -> List[float]:
+    timings = []
+    service = ModelService() if warm else None
+    feature_cache = FeatureCache()
+    with TemporaryDirectory() as save_path:
+        for _ in range(jobs):
+            start = time.perf_counter()
+            if not warm:
+                backend.clear_session()
+                service = ModelService()
+                feature_cache = FeatureCache()
+            StyleTransfer(target_image, style_image, save_path, iterations=iterations,
+                          service=service, feature_cache=feature_cache).transfer()
+            timings.append(time.perf_counter() - start)
+    backend.clear_session()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('target_image')
+    parser.add_argument('style_image')
+    parser.add_argument('--jobs', type=int, default=3)
+    parser.add_argument('--iterations', type=int, default=1)
+    args = parser.parse_args()
+
+    for name, warm in (('cold', False), ('warm', True)):
+        timings = run_jobs(args.target_image, args.style_image, args.jobs, args.iterations, warm)
+        formatted = ', '.join(f'{timing:.2f}' for timing in timings)
+        print(f'{name}: mean {mean(timings):.2f}s per job ({formatted})')
+
+
+if __name__ == '__main__':
+    main()
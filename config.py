@@ -13,8 +13,47 @@ class Config:
     FLASKY_POSTS_PER_PAGE = 20
     FLASKY_FOLLOWERS_PER_PAGE = 10
     FLASKY_COMMENTS_PER_PAGE = 10
+    FLASKY_IMAGES_PER_PAGE = 12
+    FLASKY_TIMELINE_FANOUT_LIMIT = 1000  # followers, posts of authors with more are read from posts on every load
     TTL_TOKEN = 3600  # seconds
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # bytes of a request body
+    UPLOAD_LIMITS = {  # bytes of a request body by endpoint
+        'uploads.upload': 8 * 1024 * 1024,
+        'transfer.style_transfer': 16 * 1024 * 1024,
+    }
+    UPLOAD_SPOOL_DIR = join('images', 'spool')  # relative to static folder, to link uploads to the blob store
     MODEL_ITERATION = 10
+    TRANSFER_WORKER_PROCESSES = 2
+    TRANSFER_WORKER_POLL_INTERVAL = 1  # seconds
+    TRANSFER_QUEUE_MAX_DEPTH = 50  # queued jobs of all users
+    TRANSFER_MAX_JOBS_PER_USER = 3  # queued and running jobs of one user
+    TRANSFER_MAX_RUNNING_PER_USER = 1
+    TRANSFER_BATCH_SIZE = 4  # jobs of one image size optimized together by a worker
+    TRANSFER_OPTIMIZER = 'lbfgs'  # lbfgs, adam or gd
+    TRANSFER_OPTIMIZER_STEPS = 10  # optimizer steps between result snapshots
+    TRANSFER_MAX_EVALUATIONS = 100  # loss evaluations budget of one image, None for unlimited
+    TRANSFER_EARLY_STOPPING_PATIENCE = 2  # iterations without loss improvement, 0 disables early stopping
+    TRANSFER_EARLY_STOPPING_MIN_DELTA = 0.005  # relative loss improvement
+    TRANSFER_PYRAMID_LEVELS = None  # coarse-to-fine (scale, iterations) schedule, e.g. [(.25, 10), (.5, 5), (1., 3)]
+    TRANSFER_JOB_CANCELLATION = True
+    TRANSFER_STATUS_POLL_INTERVAL = 2000  # milliseconds
+    TRANSFER_SNAPSHOT_MODE = 'final'  # final or every, workers need result files
+    TRANSFER_SNAPSHOT_EVERY = 5  # iterations between intermediate images in the every mode
+    TRANSFER_SNAPSHOT_FORMAT = 'png'  # png, jpeg or webp
+    TRANSFER_SNAPSHOT_QUALITY = 90  # jpeg and webp quality
+    TRANSFER_ARTIFACT_TTL_DAYS = 7  # days after which files of finished jobs are collected by transfer-gc
+    TRANSFER_RESULT_CACHE_SIZE = 512 * 1024 * 1024  # bytes of cached results of equal jobs, 0 disables the cache
+    TRANSFER_PREVIEW_SIZE = 256  # pixels of the longer side of the progress preview
+    TRANSFER_PREVIEW_QUALITY = 75  # JPEG quality of the progress preview
+    TRANSFER_EVENTS_TIMEOUT = 20  # seconds of one progress stream, the browser reconnects after it, 0 to poll
+    TRANSFER_PRECISION = 'float32'  # float32, or float16 for the VGG19 convolutions, compare with benchmarks.precision
+    TRANSFER_STYLE_PRESET = 'full'  # full, or fast without block5 of VGG19, see style_transfer.loss.STYLE_PRESETS
+    TRANSFER_FEATURE_CACHE_DIR = join(basedir, 'cache', 'features')
+    TRANSFER_FEATURE_CACHE_SIZE = 32  # feature sets kept in memory of every worker
+    TRANSFER_FEATURE_CACHE_DISK_SIZE = 256 * 1024 * 1024  # bytes of style gram matrices in TRANSFER_FEATURE_CACHE_DIR
+    GALLERY_RENDITION_WIDTHS = (240, 480)  # pixels, renditions are made for images wider than these
+    GALLERY_RENDITION_FORMAT = 'webp'  # webp or jpeg
+    GALLERY_RENDITION_QUALITY = 80
 
     @staticmethod
     def init_app(app):
@@ -1,12 +1,16 @@
 import os
+from datetime import datetime, timedelta
 from unittest import TestLoader, TextTestRunner
 
 import click
 
 from app import create_app, db
-from app.models import User, Role, Post
+from app.models import User, Role, Post, Comment, TransferArtifact, TransferResult, Images, TimelineEntry
+from app.renditions import Renditions
+from app.transfer.worker import WorkerPool
 
-app = create_app(os.getenv('FLASK_ENV') or 'default')
+config_name = os.getenv('FLASK_ENV') or 'default'
+app = create_app(config_name)
 
 
 @app.shell_context_processor
@@ -22,3 +26,54 @@ def test(test_names):
     TextTestRunner(verbosity=2).run(tests)
 
 
+@app.cli.command('transfer-worker')
+@click.option('--processes', type=int, help='Number of worker processes.')
+def transfer_worker(processes):
+    """Run the style transfer worker pool."""
+    click.echo(f'Requeued {WorkerPool.requeue_stale()} jobs of stopped workers.')
+    WorkerPool(config_name, processes or app.config['TRANSFER_WORKER_PROCESSES']).run()
+
+
+@app.cli.command('transfer-gc')
+@click.option('--days', type=int, help='Age of finished jobs, which files are removed.')
+def transfer_gc(days):
+    """Remove files of old style transfer jobs and unknown buffer files."""
+    days = app.config['TRANSFER_ARTIFACT_TTL_DAYS'] if days is None else days
+    removed = TransferArtifact.collect_garbage(app.static_folder, datetime.utcnow() - timedelta(days=days))
+    # results of the collected jobs are kept only by the cache now
+    evicted = TransferResult.evict(app.config['TRANSFER_RESULT_CACHE_SIZE'])
+    click.echo(f'Removed {removed} files, evicted {evicted} cached results.')
+
+
+@app.cli.command('migrate-saves')
+def migrate_saves():
+    """Move saved images from per-user saves folders to the blob store."""
+    click.echo(f'Moved {Images.migrate_saves(app.static_folder)} files.')
+
+
+@app.cli.command('repair-counters')
+def repair_counters():
+    """Recompute post counts of users and comment counts of posts."""
+    click.echo(f'Repaired post counts of {User.repair_post_counts()} users '
+               f'and comment counts of {Post.repair_comment_counts()} posts.')
+
+
+@app.cli.command('backfill-timelines')
+def backfill_timelines():
+    """Write home timelines of all users from follows and posts."""
+    click.echo(f'Wrote {TimelineEntry.rebuild()} timeline entries.')
+
+
+@app.cli.command('rerender-markdown')
+@click.option('--workers', type=int, default=4, help='Number of rendering processes.')
+@click.option('--batch-size', type=int, default=100, help='Rows rendered by a process at once.')
+def rerender_markdown(workers, batch_size):
+    """Render HTML of all posts and comments again."""
+    click.echo(f'Rendered {Post.rerender(workers, batch_size)} posts '
+               f'and {Comment.rerender(workers, batch_size)} comments.')
+
+
+@app.cli.command('backfill-renditions')
+def backfill_renditions():
+    """Make gallery renditions of saved images, which do not have them."""
+    click.echo(f'Processed {Images.backfill_renditions(Renditions.from_app(app))} images.')
@@ -1 +1,7 @@
+from .batch_transfer import BatchStyleTransfer
+from .feature_cache import FeatureCache
+from .model_service import ModelService, get_model_service
+from .optimizers import EarlyStopping, OPTIMIZERS
+from .snapshots import SnapshotPolicy
 from .style_transfer import StyleTransfer
+from .tiled_transfer import TiledStyleTransfer
@@ -0,0 +1,254 @@
+import os
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from numpy import ndarray
+
+from .evaluator import Evaluator
+from .feature_cache import FeatureCache, default_feature_cache
+from .input_images import InputImages
+from .model_service import ModelService, get_model_service
+from .optimizers import EarlyStopping, make_optimizer
+from .process_image import ProcessImage
+from .snapshots import SnapshotPolicy, SnapshotWriter
+
+
+class BatchStyleTransfer:
+    """Style transfer of several independent (target, style) pairs at once.
+    All combination images must have one size, so use image_size to group pairs.
+    """
+
+    def __init__(self, pairs: List[Tuple[str, str]], save_paths: List[str], iterations: int = 10,
+                 prefixes: Optional[List[str]] = None, img_height: int = 400, img_width: Optional[int] = None,
+                 service: Optional[ModelService] = None, feature_cache: Optional[FeatureCache] = None,
+                 levels: Optional[List[Tuple[float, int]]] = None, optimizer: str = 'lbfgs',
+                 optimizer_options: Optional[dict] = None, steps: int = 10, max_evaluations: Optional[int] = None,
+                 early_stopping: Optional[EarlyStopping] = None, snapshots: Optional[SnapshotPolicy] = None,
+                 decode_workers: int = 4):
+        """
+        :param iterations: rounds of optimizer steps, callback is called after every round
+        :param levels: coarse-to-fine schedule: (scale of the result size, iterations) for every level,
+                       the last level is always run at the result size; by default one level of `iterations`
+        :param optimizer: lbfgs, adam or gd
+        :param steps: optimizer steps in one iteration
+        :param max_evaluations: loss evaluations budget of every sample
+        :param early_stopping: finishes the level for samples, which loss does not improve anymore
+        :param snapshots: which images are written and in which format, by default only results as PNG
+        :param decode_workers: threads decoding input images
+        """
+        self.pairs = pairs
+        self.img_height = img_height
+        self.img_width = img_width or self.image_size(pairs[0][0], img_height)[1]
+        self.save_paths = save_paths
+        self.iterations = iterations
+        self.prefixes = prefixes or [f'image_{index}' for index in range(len(pairs))]
+        self.service = service
+        self.feature_cache = feature_cache or default_feature_cache
+        self.optimizer = optimizer
+        self.optimizer_options = optimizer_options or {}
+        self.steps = steps
+        self.max_evaluations = max_evaluations
+        self.early_stopping = early_stopping
+        self.snapshots = snapshots or SnapshotPolicy()
+        self.decode_workers = decode_workers
+
+        self.levels = list(levels or [(1., iterations)])
+        if self.levels[-1][0] != 1.:
+            self.levels.append((1., self.levels[-1][1]))
+
+        self.evaluations = np.zeros(len(pairs), dtype=int)
+        self.evaluation_times: List[float] = []
+        self.level_times: List[Tuple[int, int, float]] = []
+        self.last_iterations: List[int] = [0] * len(pairs)
+        self.written: List[List[str]] = [[] for _ in pairs]  # files written for every sample, result included
+
+    @staticmethod
+    def image_size(target_image_path: str, img_height: int = 400, width_step: int = 16) -> Tuple[int, int]:
+        """Size of the combination image, width is rounded to width_step to let more pairs share a batch"""
+        width, height = ProcessImage.image_size(target_image_path)
+        img_width = max(width_step, round(width * img_height / height / width_step) * width_step)
+        return img_height, img_width
+
+    def level_size(self, scale: float) -> Tuple[int, int]:
+        return max(32, round(self.img_height * scale)), max(32, round(self.img_width * scale))
+
+    def features(self, service: ModelService, inputs: InputImages, index: int, target_image: 'ndarray',
+                 img_height: int, img_width: int) -> List['ndarray']:
+        """Target content features and style gram matrices, taken from the cache when possible"""
+        target_image_path, style_reference_image_path = self.pairs[index]
+        target_features = self.feature_cache.get_or_compute(
+            FeatureCache.key('content', FeatureCache.file_hash(target_image_path), img_height, img_width,
+                             service.precision, service.preset),
+            lambda: service.content_features(target_image)
+        )
+        style_grams = self.feature_cache.get_or_compute(
+            FeatureCache.key('style', FeatureCache.file_hash(style_reference_image_path), img_height, img_width,
+                             service.precision, service.preset),
+            lambda: service.style_grams(inputs.preprocess(style_reference_image_path, img_height, img_width))
+        )
+        return target_features + style_grams
+
+    @property
+    def total_iterations(self) -> int:
+        """Iterations of all levels, samples stopped early run fewer"""
+        return sum(level_iterations for _, level_iterations in self.levels)
+
+    def snapshot_path(self, index: int, iteration: int) -> str:
+        return os.path.join(self.save_paths[index],
+                            self.prefixes[index] + f'_at_iteration_{iteration}.{self.snapshots.extension}')
+
+    def write_snapshot(self, writer: SnapshotWriter, index: int, iteration: int, image: 'ndarray') -> 'Future':
+        path = self.snapshot_path(index, iteration)
+        self.written[index].append(path)
+        return writer.write(path, image)
+
+    def exhausted(self, index: int) -> bool:
+        return self.max_evaluations is not None and self.evaluations[index] >= self.max_evaluations
+
+    def statistics(self) -> dict:
+        return {
+            'evaluations': self.evaluations.tolist(),
+            'evaluation_time_mean': float(np.mean(self.evaluation_times)) if self.evaluation_times else None,
+            'evaluation_time_max': max(self.evaluation_times, default=None),
+            'level_times': self.level_times
+        }
+
+    def transfer(self, callback: Optional[Callable[[int, int, float, 'ndarray'], None]] = None
+                 ) -> List[Union[str, 'ndarray', Exception]]:
+        """Run style transfer of all pairs.
+        :param callback: called after every iteration with sample index, iteration number, loss value
+                         and the current image (uint8, height x width x RGB, reused after the call),
+                         may raise an exception to stop transfer of this sample
+        :return: path of the result image (the image itself for in-memory snapshots)
+                 or the exception, which stopped the sample, for every pair
+        """
+        print(f'Start transfer of {len(self.pairs)} images.')
+
+        writer = SnapshotWriter(self.snapshots)
+        # styles are decoded on a feature cache miss only
+        inputs = InputImages([target for target, _ in self.pairs], self.img_height, self.img_width,
+                             self.decode_workers)
+        try:
+            results = self._transfer(writer, inputs, callback)
+        finally:
+            writer.close()
+            inputs.close()
+
+        for index, result in enumerate(results):
+            if isinstance(result, Future):
+                results[index] = result.exception() or self.snapshot_path(index, self.last_iterations[index])
+
+        statistics = self.statistics()
+        print(f'Transfer completed: {statistics["evaluations"]} evaluations, '
+              f'{statistics["evaluation_time_mean"]} seconds per evaluation.')
+        return results
+
+    def _transfer(self, writer: SnapshotWriter, inputs: InputImages, callback) -> list:
+        """Optimization loop, results of finished samples are pending writes"""
+        service = self.service or get_model_service()
+        results: list = [None] * len(self.pairs)
+        active = list(range(len(self.pairs)))
+        images: Dict[int, 'ndarray'] = {}
+        writes: Dict[Tuple[int, int], 'Future'] = {}
+        self.last_iterations = [0] * len(self.pairs)
+        self.written = [[] for _ in self.pairs]
+        self.evaluations[:] = 0
+        self.evaluation_times = []
+        self.level_times = []
+
+        def finish(index: int):
+            if index not in images:
+                return
+            if self.snapshots.in_memory:
+                results[index] = images[index]
+                return
+            key = (index, self.last_iterations[index])
+            results[index] = writes.get(key) or self.write_snapshot(writer, *key, images[index])
+
+        x = None
+        previous_size = None
+        i = 0
+        for scale, level_iterations in self.levels:
+            if not active:
+                break
+            level_start_time = time.time()
+            img_height, img_width = self.level_size(scale)
+
+            target_images: Dict[int, 'ndarray'] = {
+                index: inputs.preprocess(self.pairs[index][0], img_height, img_width) for index in active
+            }
+            level_x = np.zeros((len(self.pairs), img_height * img_width * 3))
+            for index in active:
+                if x is None:
+                    level_x[index] = target_images[index].flatten()
+                else:
+                    level_x[index] = ProcessImage.resize(
+                        x[index].reshape(previous_size + (3,)), img_height, img_width).flatten()
+            previous_size = (img_height, img_width)
+
+            features = {index: self.features(service, inputs, index, target_images[index], img_height, img_width)
+                        for index in active}
+            evaluator = Evaluator(service.fetch_loss_and_grads,
+                                  features,
+                                  img_height,
+                                  img_width,
+                                  fetch_gradient_step=service.fetch_gradient_step,
+                                  evaluations=self.evaluations)
+            optimizer = make_optimizer(self.optimizer, evaluator, **self.optimizer_options)
+            optimizer.start(level_x, active)
+            if self.early_stopping:
+                self.early_stopping.reset()
+
+            # every sample is deprocessed into its own buffer, reused by the next iterations of the level
+            outputs = {index: np.empty((img_height, img_width, 3), dtype='uint8') for index in active}
+            scratch = np.empty((img_height, img_width, 3), dtype='float32')
+
+            level_active = list(active)
+            for _ in range(level_iterations):
+                if not level_active:
+                    break
+                start_time = time.time()
+                for _ in range(self.steps):
+                    stepping = [index for index in level_active if not self.exhausted(index)]
+                    if not stepping:
+                        break
+                    optimizer.step(stepping)
+
+                for index in list(level_active):
+                    loss_value = float(optimizer.losses[index])
+                    img = ProcessImage.deprocess_into(optimizer.x[index], outputs[index], scratch)
+                    images[index] = img
+                    self.last_iterations[index] = i
+                    if self.snapshots.intermediate(i):
+                        writes[index, i] = self.write_snapshot(writer, index, i, img.copy())
+
+                    try:
+                        if callback:
+                            callback(index, i, loss_value, img)
+                    except Exception as err:
+                        results[index] = err
+                        level_active.remove(index)
+                        active.remove(index)
+                        continue
+
+                    if self.exhausted(index):
+                        level_active.remove(index)
+                        active.remove(index)
+                        finish(index)
+                    elif self.early_stopping and self.early_stopping.converged(index, loss_value):
+                        level_active.remove(index)
+
+                print(f'Iteration {i} of {len(level_active)} images completed in {time.time() - start_time}.')
+                i += 1
+
+            x = optimizer.x
+            self.evaluation_times += evaluator.timings
+            level_time = time.time() - level_start_time
+            self.level_times.append((img_height, img_width, level_time))
+            print(f'Level {img_height}x{img_width} completed in {level_time}.')
+
+        for index in active:
+            finish(index)
+        return results
@@ -1,42 +1,80 @@
+import time
+from typing import Dict, List, Sequence, Tuple
+
 import numpy as np
 from numpy import ndarray
-from keras import backend
-from keras import Model
-
-from .loss import Loss
 
 
 class Evaluator:
+    """Loss and gradients of a batch of combination images in one forward and backward pass.
+    Samples are addressed by their index in the transfer, so stopped samples can leave the batch.
+    Inputs and outputs go through buffers allocated once, so returned arrays are valid
+    only until the next call.
+    """
 
-    def __init__(self, model: 'Model', combination_image, img_height: int, img_width: int):
-        self.model = model
-        self.loss_value = None
-        self.grads_values = None
-        self.combination_image = combination_image
+    def __init__(self, fetch_loss_and_grads, features: Dict[int, List['ndarray']], img_height: int, img_width: int,
+                 fetch_gradient_step=None, evaluations: 'ndarray' = None):
+        """
+        :param fetch_loss_and_grads: backend function of combination images and features
+        :param features: precomputed target features and style gram matrices by sample index
+        :param fetch_gradient_step: backend function, which also makes a gradient descent step
+        :param evaluations: evaluations counter by sample index, shared between evaluators of one transfer
+        """
+        self.fetch_loss_and_grads = fetch_loss_and_grads
+        self.fetch_gradient_step = fetch_gradient_step
+        self.rows = {index: row for row, index in enumerate(features)}
+        self.features = [np.stack(layer_features) for layer_features in zip(*features.values())]
         self.img_height = img_height
         self.img_width = img_width
+        self.evaluations = evaluations if evaluations is not None else np.zeros(max(features) + 1, dtype=int)
+        self.timings: List[float] = []
+
+        samples = len(self.rows)
+        self._images = np.empty((samples, img_height, img_width, 3), dtype='float32')
+        self._losses = np.empty(samples, dtype='float64')
+        self._flat = np.empty((samples, img_height * img_width * 3), dtype='float64')
+        self._features_indices = None
+        self._features_subset = None
+
+    def _features(self, indices: Sequence[int]) -> List['ndarray']:
+        """Features of given samples, the subset is kept until samples change"""
+        indices = tuple(indices)
+        if indices != self._features_indices:
+            rows = [self.rows[index] for index in indices]
+            if rows == list(range(len(self.rows))):
+                self._features_subset = self.features
+            else:
+                self._features_subset = [layer_features[rows] for layer_features in self.features]
+            self._features_indices = indices
+        return self._features_subset
+
+    def _inputs(self, x: 'ndarray', indices: Sequence[int]) -> list:
+        images = self._images[:len(indices)]
+        np.copyto(images, x.reshape(images.shape), casting='same_kind')
+        return [images] + self._features(indices)
+
+    def _outputs(self, losses: 'ndarray', flat: 'ndarray', indices: Sequence[int],
+                 start_time: float) -> Tuple['ndarray', 'ndarray']:
+        count = len(indices)
+        np.copyto(self._losses[:count], losses)
+        np.copyto(self._flat[:count], flat.reshape((count, -1)))
+        self.evaluations[list(indices)] += 1
+        self.timings.append(time.perf_counter() - start_time)
+        return self._losses[:count], self._flat[:count]
+
+    def __call__(self, x: 'ndarray', indices: Sequence[int]) -> Tuple['ndarray', 'ndarray']:
+        """
+        :param x: flat combination images of samples with given indices, shape: (len(indices), pixels)
+        :return: loss of every sample, gradients of shape like x
+        """
+        start_time = time.perf_counter()
+        losses, grads = self.fetch_loss_and_grads(self._inputs(x, indices))
+        return self._outputs(losses, grads, indices, start_time)
 
-    def __new__(cls, model: 'Model', combination_image, img_height: int, img_width: int):
-
-        loss = Loss(model, img_height, img_width).total_loss(combination_image)
-        grads = backend.gradients(loss, combination_image)[0]
-        cls.fetch_loss_and_grands = backend.function([combination_image], [loss, grads])
-        instance = super().__new__(cls)
-        return instance
-
-    def loss(self, x: 'ndarray'):
-        assert self.loss_value is None
-        x = x.reshape((1, self.img_height, self.img_width, 3))
-        outs = self.fetch_loss_and_grands([x])
-        loss_value = outs[0]
-        grad_value = outs[1].flatten().astype('float64')
-        self.loss_value = loss_value
-        self.grads_values = grad_value
-        return self.loss_value
-
-    def grads(self, x: 'ndarray'):
-        assert self.loss_value is not None
-        grad_values = np.copy(self.grads_values)
-        self.loss_value = None
-        self.grads_values = None
-        return grad_values
+    def gradient_step(self, x: 'ndarray', indices: Sequence[int], learning_rate: float) -> Tuple['ndarray', 'ndarray']:
+        """Gradient descent step computed by the backend
+        :return: loss of every sample before the step, flat images after the step
+        """
+        start_time = time.perf_counter()
+        losses, stepped = self.fetch_gradient_step(self._inputs(x, indices) + [learning_rate])
+        return self._outputs(losses, stepped, indices, start_time)
@@ -0,0 +1,128 @@
+import hashlib
+import os
+from collections import OrderedDict
+from os.path import join, exists
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+
+class FeatureCache:
+    """Image features by image content hash and size.
+    Recently used features are kept in memory. If cache_dir is set, features of the persistent kinds
+    are stored on disk too, least recently used files are removed over max_disk_size.
+    Content features are not persistent by default: targets are mostly unique uploads.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_items: int = 32, max_disk_size: int = 256 * 2 ** 20,
+                 persistent_kinds: Tuple[str, ...] = ('style',)):
+        """
+        :param max_disk_size: bytes of files in cache_dir
+        :param persistent_kinds: kinds of keys stored on disk, see key
+        """
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.max_disk_size = max_disk_size
+        self.persistent_kinds = persistent_kinds
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def file_hash(path: str, chunk_size: int = 1 << 16) -> str:
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def key(kind: str, image_hash: str, img_height: int, img_width: int,
+            precision: str = 'float32', preset: str = 'full') -> str:
+        """Features of other precisions and style presets differ, so they are kept apart"""
+        key = f'{kind}-{image_hash}-{img_height}x{img_width}'
+        if precision != 'float32':
+            key += f'-{precision}'
+        if preset != 'full':
+            key += f'-{preset}'
+        return key
+
+    def _file_path(self, key: str) -> str:
+        return join(self.cache_dir, f'{key}.npz')
+
+    def _persistent(self, key: str) -> bool:
+        return bool(self.cache_dir) and key.split('-', 1)[0] in self.persistent_kinds
+
+    def _remember(self, key: str, arrays: List['ndarray']):
+        with self._lock:
+            self._items[key] = arrays
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, key: str) -> Optional[List['ndarray']]:
+        with self._lock:
+            arrays = self._items.get(key)
+            if arrays is not None:
+                self._items.move_to_end(key)
+                return arrays
+
+        if not self._persistent(key) or not exists(self._file_path(key)):
+            return None
+
+        try:
+            with np.load(self._file_path(key)) as stored:
+                arrays = [stored[f'arr_{index}'] for index in range(len(stored.files))]
+            os.utime(self._file_path(key))  # recently used, see evict
+        except OSError:  # evicted by another worker meanwhile
+            return None
+        self._remember(key, arrays)
+        return arrays
+
+    def put(self, key: str, arrays: List['ndarray']):
+        self._remember(key, arrays)
+        if not self._persistent(key):
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with NamedTemporaryFile(dir=self.cache_dir, suffix='.tmp', delete=False) as file:
+            np.savez(file, *arrays)
+        os.replace(file.name, self._file_path(key))
+        self.evict()
+
+    def evict(self) -> int:
+        """Remove least recently used files, until the rest fits into max_disk_size bytes
+        :return: count of removed files
+        """
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # removed by another worker
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def get_or_compute(self, key: str, compute: Callable[[], List['ndarray']]) -> List['ndarray']:
+        arrays = self.get(key)
+        if arrays is None:
+            arrays = compute()
+            self.put(key, arrays)
+        return arrays
+
+
+default_feature_cache = FeatureCache()
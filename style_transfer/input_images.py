@@ -0,0 +1,39 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable
+
+from PIL import Image
+from numpy import ndarray
+
+from .process_image import ProcessImage
+
+
+class InputImages:
+    """Target and style images of a transfer, every file is decoded once on a thread pool.
+    Decoding of the eager paths starts on creation, so it overlaps with whatever the caller does next,
+    e.g. model warm-up. Other images, e.g. styles which features are usually cached, are decoded on first use.
+    """
+
+    def __init__(self, paths: Iterable[str], img_height: int, img_width: int, workers: int = 4):
+        """
+        :param paths: images decoded at once
+        :param img_height: the largest size the images are used at
+        """
+        self.img_height = img_height
+        self.img_width = img_width
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='decode')
+        self.decoded: Dict[str, 'Future'] = {path: self._submit(path) for path in set(paths)}
+
+    def _submit(self, path: str) -> 'Future':
+        return self.executor.submit(ProcessImage.decode, path, self.img_height, self.img_width)
+
+    def image(self, path: str) -> 'Image.Image':
+        if path not in self.decoded:
+            self.decoded[path] = self._submit(path)
+        return self.decoded[path].result()
+
+    def preprocess(self, path: str, img_height: int, img_width: int) -> 'ndarray':
+        return ProcessImage(img_height, img_width).preprocess(self.image(path))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.decoded = {}
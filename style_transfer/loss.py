@@ -1,63 +1,112 @@
+from typing import List
+
 from keras import backend
 from keras import Model
 
 
+STYLE_PRESETS = {
+    # full quality, the model runs up to block5_conv2
+    'full': {
+        'content_layer': 'block5_conv2',
+        'style_layers': {
+            'block1_conv1': .2,
+            'block2_conv1': .2,
+            'block3_conv1': .2,
+            'block4_conv1': .2,
+            'block5_conv1': .2,
+        },
+        'content_weight': 0.05,
+        'total_variation_weight': 1e-4,
+    },
+    # block5 and half of block4 are skipped: weaker coarse style patterns, about a quarter less computation
+    'fast': {
+        'content_layer': 'block4_conv2',
+        'style_layers': {
+            'block1_conv1': .25,
+            'block2_conv1': .25,
+            'block3_conv1': .25,
+            'block4_conv1': .25,
+        },
+        'content_weight': 0.05,
+        'total_variation_weight': 1e-4,
+    },
+}
+
+
 class Loss:
+    """Loss of a batch of combination images, computed separately for every sample.
+    Layers and weights are taken from the style preset.
+    """
 
-    def __init__(self, model: 'Model', img_height: int, img_width: int):
+    def __init__(self, model: 'Model', preset: str = 'full'):
+        if preset not in STYLE_PRESETS:
+            raise ValueError(f'Unknown style preset {preset}.')
         self.model = model
-        self.img_height = img_height
-        self.img_width = img_width
+        self.content_layer = STYLE_PRESETS[preset]['content_layer']
+        self.style_weights = STYLE_PRESETS[preset]['style_layers']
+        self.style_layers = list(self.style_weights)
+        self.content_weight = STYLE_PRESETS[preset]['content_weight']
+        self.total_variation_weight = STYLE_PRESETS[preset]['total_variation_weight']
+        # features of a reduced precision model are cast back, so grams and losses are summed in float32
+        self.outputs_dict = dict((layer.name, self.float32(layer.output)) for layer in self.model.layers)
+
+    @staticmethod
+    def layers(preset: str) -> List[str]:
+        """Model layers read by the loss of the preset"""
+        return [STYLE_PRESETS[preset]['content_layer']] + list(STYLE_PRESETS[preset]['style_layers'])
+
+    @staticmethod
+    def float32(x):
+        return x if backend.dtype(x) == 'float32' else backend.cast(x, 'float32')
 
     @staticmethod
     def content_loss(base, combination):
-        return backend.mean(backend.square(combination - base))
+        return backend.mean(backend.square(combination - base), axis=[1, 2, 3])
 
     @staticmethod
     def gram_matrix(x):
-        features = backend.batch_flatten(backend.permute_dimensions(x, (2, 0, 1)))
-        gram = backend.dot(features, backend.transpose(features))
-        return gram
+        """Gram matrices of a batch of feature maps, shape: (batch, channels, channels)"""
+        shape = backend.shape(x)
+        features = backend.reshape(x, [shape[0], shape[1] * shape[2], backend.int_shape(x)[-1]])
+        return backend.batch_dot(features, features, axes=1)
+
+    @staticmethod
+    def image_size(x):
+        shape = backend.shape(x)
+        return backend.cast(shape[1] * shape[2], 'float32')
 
-    def style_loss(self, style, combination):
-        s = self.gram_matrix(style)
+    def style_loss(self, style_gram, combination, size):
         c = self.gram_matrix(combination)
         channels = 3
-        size = self.img_height * self.img_width
-        return backend.sum(backend.square(s - c)) / (4. * (channels ** 2) * (size ** 2))
-
-    def total_variation_loss(self, x):
-        a = backend.square(x[:, :self.img_height - 1, :self.img_width - 1] - x[:, 1, :self.img_width - 1, :])
-        b = backend.square(x[:, :self.img_height - 1, :self.img_width - 1] - x[:, :self.img_height - 1, 1:, :])
-        return backend.sum(backend.pow(a + b, 1.25))
-
-    def total_loss(self, combination_image):
-        outputs_dict = dict((layer.name, layer.output) for layer in self.model.layers)
-        content_layer = 'block5_conv2'
-        style_layers = [
-            'block1_conv1',
-            'block2_conv1',
-            'block3_conv1',
-            'block4_conv1',
-            'block5_conv1'
-        ]
-        total_variation_weight = 1e-4
-        style_weight = 1.
-        content_weight = 0.05
-
-        loss = backend.variable(0.)
-        layer_features = outputs_dict[content_layer]
-        target_image_features = layer_features[0, :, :, :]
-        combination_features = layer_features[2, :, :, :]
-
-        loss += content_weight * self.content_loss(target_image_features, combination_features)
-
-        for layer_name in style_layers:
-            layer_features = outputs_dict[layer_name]
-            style_reference_features = layer_features[1, :, :, :]
-            combination_features = layer_features[2, :, :, :]
-            sl = self.style_loss(style_reference_features, combination_features)
-            loss += (style_weight / len(style_layers)) * sl
-
-        loss += total_variation_weight * self.total_variation_loss(combination_image)
+        return backend.sum(backend.square(style_gram - c), axis=[1, 2]) / (4. * (channels ** 2) * (size ** 2))
+
+    @staticmethod
+    def total_variation_loss(x):
+        a = backend.square(x[:, :-1, :-1, :] - x[:, 1:, :-1, :])
+        b = backend.square(x[:, :-1, :-1, :] - x[:, :-1, 1:, :])
+        return backend.sum(backend.pow(a + b, 1.25), axis=[1, 2, 3])
+
+    def content_features(self):
+        return self.outputs_dict[self.content_layer]
+
+    def style_grams(self) -> list:
+        return [self.gram_matrix(self.outputs_dict[layer_name]) for layer_name in self.style_layers]
+
+    def style_channels(self) -> List[int]:
+        return [backend.int_shape(self.outputs_dict[layer_name])[-1] for layer_name in self.style_layers]
+
+    def total_loss(self, combination_image, target_features, style_grams: List):
+        """Loss of every combination image against precomputed target features and style gram matrices
+        :return: tensor of shape (batch,)
+        """
+        size = self.image_size(combination_image)
+
+        loss = self.content_weight * self.content_loss(target_features, self.content_features())
+
+        for layer_name, style_gram in zip(self.style_layers, style_grams):
+            combination_features = self.outputs_dict[layer_name]
+            sl = self.style_loss(style_gram, combination_features, size)
+            loss += self.style_weights[layer_name] * sl
+
+        loss += self.total_variation_weight * self.total_variation_loss(combination_image)
         return loss
@@ -0,0 +1,93 @@
+from threading import Lock
+from typing import Dict, List, Tuple
+
+from keras import Model, backend
+from keras.applications import VGG19
+from numpy import ndarray
+
+from .loss import Loss
+
+
+class ModelService:
+    """VGG19 convolutional base with the loss graph on top of it.
+    Images are fed through placeholders of any size and batch, so the graph is built
+    and the weights are loaded only once per process.
+    Target and style images go through the model only to compute their features,
+    the loss graph gets them precomputed and runs the model on the combination images only.
+    The model is cut after the deepest layer read by the loss of the style preset.
+    In the float16 precision the convolutions run in half precision,
+    while images, features and the loss stay float32.
+    """
+    PRECISIONS = ('float32', 'float16')
+
+    def __init__(self, precision: str = 'float32', preset: str = 'full'):
+        """
+        :param precision: float32 or float16
+        :param preset: style preset of the loss, see loss.STYLE_PRESETS
+        """
+        if precision not in self.PRECISIONS:
+            raise ValueError(f'Unknown precision {precision}.')
+        self.precision = precision
+        self.preset = preset
+        self.combination_image = backend.placeholder((None, None, None, 3))
+
+        model_input = self.combination_image
+        if precision != 'float32':
+            model_input = backend.cast(self.combination_image, precision)
+        floatx = backend.floatx()
+        backend.set_floatx(precision)
+        try:
+            vgg = VGG19(input_tensor=model_input, weights='imagenet', include_top=False)
+        finally:
+            backend.set_floatx(floatx)
+        self.model = self.truncate(vgg, Loss.layers(preset))
+
+        loss = Loss(self.model, preset)
+        content_features = loss.content_features()
+        self.fetch_content_features = backend.function([self.combination_image], [content_features])
+        self.fetch_style_grams = backend.function([self.combination_image], loss.style_grams())
+
+        self.target_features = backend.placeholder(backend.int_shape(content_features))
+        self.style_grams = [backend.placeholder((None, channels, channels)) for channels in loss.style_channels()]
+
+        losses = loss.total_loss(self.combination_image, self.target_features, self.style_grams)
+        grads = backend.gradients(backend.sum(losses), self.combination_image)[0]
+        self.fetch_loss_and_grads = backend.function(
+            [self.combination_image, self.target_features] + self.style_grams,
+            [losses, grads]
+        )
+
+        self.learning_rate = backend.placeholder(())
+        grads_scale = backend.mean(backend.abs(grads), axis=[1, 2, 3], keepdims=True) + backend.epsilon()
+        stepped_image = self.combination_image - self.learning_rate * grads / grads_scale
+        self.fetch_gradient_step = backend.function(
+            [self.combination_image, self.target_features] + self.style_grams + [self.learning_rate],
+            [losses, stepped_image]
+        )
+
+    @staticmethod
+    def truncate(model: 'Model', layer_names: List[str]) -> 'Model':
+        """Model with the layers up to the deepest of the given ones"""
+        order = [layer.name for layer in model.layers]
+        deepest = max(layer_names, key=order.index)
+        return Model(model.input, model.get_layer(deepest).output)
+
+    def content_features(self, image: 'ndarray') -> List['ndarray']:
+        """Content features of one preprocessed image, without batch axis"""
+        return [features[0] for features in self.fetch_content_features([image])]
+
+    def style_grams(self, image: 'ndarray') -> List['ndarray']:
+        """Style gram matrices of one preprocessed image, without batch axis"""
+        return [gram[0] for gram in self.fetch_style_grams([image])]
+
+
+_services: Dict[Tuple[str, str], ModelService] = {}
+_service_lock = Lock()
+
+
+def get_model_service(precision: str = 'float32', preset: str = 'full') -> ModelService:
+    """Return model service of the current process, build it on the first call."""
+    with _service_lock:
+        if (precision, preset) not in _services:
+            _services[precision, preset] = ModelService(precision, preset)
+        return _services[precision, preset]
@@ -0,0 +1,185 @@
+from collections import deque
+from typing import Dict, List, Sequence, Type
+
+import numpy as np
+from numpy import ndarray
+
+from .evaluator import Evaluator
+
+
+class Optimizer:
+    """Minimizes loss of every sample of the batch independently.
+    Samples make steps together, so each evaluation is one batched pass of the model.
+    """
+    name = None
+
+    def __init__(self, evaluator: Evaluator):
+        self.evaluator = evaluator
+        self.x = None
+        self.losses = None
+        self.grads = None
+
+    def start(self, x: 'ndarray', active: Sequence[int]):
+        """
+        :param x: flat images of all samples, shape: (samples, pixels)
+        :param active: indices of samples to optimize
+        """
+        active = list(active)
+        self.x = x.astype('float64')
+        self.losses = np.full(len(x), np.nan)
+        self.grads = np.zeros_like(self.x)
+        self.losses[active], self.grads[active] = self.evaluator(self.x[active], active)
+
+    def step(self, active: Sequence[int]):
+        raise NotImplementedError
+
+
+class LBFGS(Optimizer):
+    """L-BFGS with separate curvature history and backtracking line search for every sample."""
+    name = 'lbfgs'
+
+    def __init__(self, evaluator: Evaluator, memory: int = 5, max_backtracks: int = 10, c1: float = 1e-4):
+        super().__init__(evaluator)
+        self.memory = memory
+        self.max_backtracks = max_backtracks
+        self.c1 = c1
+        self.history: List[deque] = []
+
+    def start(self, x: 'ndarray', active: Sequence[int]):
+        self.history = [deque(maxlen=self.memory) for _ in range(len(x))]
+        super().start(x, active)
+
+    def direction(self, index: int) -> 'ndarray':
+        """Two-loop recursion over the history of the sample"""
+        history = self.history[index]
+        q = self.grads[index].copy()
+        alphas = []
+        for s, y, rho in reversed(history):
+            alpha = rho * s.dot(q)
+            q -= alpha * y
+            alphas.append(alpha)
+
+        if history:
+            s, y, rho = history[-1]
+            q *= s.dot(y) / y.dot(y)
+        else:
+            q /= np.linalg.norm(q) or 1.
+
+        for (s, y, rho), alpha in zip(history, reversed(alphas)):
+            beta = rho * y.dot(q)
+            q += s * (alpha - beta)
+        return -q
+
+    def step(self, active: Sequence[int]):
+        pending = np.asarray(active)
+        directions = np.stack([self.direction(index) for index in pending])
+        slopes = np.einsum('ij,ij->i', self.grads[pending], directions)
+        step_sizes = np.ones(len(pending))
+
+        for _ in range(self.max_backtracks):
+            candidates = self.x[pending] + step_sizes[:, None] * directions
+            losses, grads = self.evaluator(candidates, pending)
+            accepted = losses <= self.losses[pending] + self.c1 * step_sizes * slopes
+
+            for position in np.flatnonzero(accepted):
+                index = pending[position]
+                s = candidates[position] - self.x[index]
+                y = grads[position] - self.grads[index]
+                sy = s.dot(y)
+                if sy > 1e-10:
+                    self.history[index].append((s, y, 1. / sy))
+                self.x[index] = candidates[position]
+                self.losses[index] = losses[position]
+                self.grads[index] = grads[position]
+
+            pending, directions = pending[~accepted], directions[~accepted]
+            slopes, step_sizes = slopes[~accepted], step_sizes[~accepted] / 2
+            if not len(pending):
+                break
+
+        for index in pending:
+            self.history[index].clear()
+
+
+class Adam(Optimizer):
+    name = 'adam'
+
+    def __init__(self, evaluator: Evaluator, learning_rate: float = 5., beta1: float = .9, beta2: float = .999,
+                 epsilon: float = 1e-8):
+        super().__init__(evaluator)
+        self.learning_rate = learning_rate
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.m = None
+        self.v = None
+        self.t = None
+
+    def start(self, x: 'ndarray', active: Sequence[int]):
+        super().start(x, active)
+        self.m = np.zeros_like(self.x)
+        self.v = np.zeros_like(self.x)
+        self.t = np.zeros(len(x), dtype=int)
+
+    def step(self, active: Sequence[int]):
+        active = list(active)
+        self.t[active] += 1
+        t = self.t[active][:, None]
+        grads = self.grads[active]
+        self.m[active] = self.beta1 * self.m[active] + (1 - self.beta1) * grads
+        self.v[active] = self.beta2 * self.v[active] + (1 - self.beta2) * grads ** 2
+        m_hat = self.m[active] / (1 - self.beta1 ** t)
+        v_hat = self.v[active] / (1 - self.beta2 ** t)
+        self.x[active] -= self.learning_rate * m_hat / (np.sqrt(v_hat) + self.epsilon)
+        self.losses[active], self.grads[active] = self.evaluator(self.x[active], active)
+
+
+class GradientDescent(Optimizer):
+    """Gradient descent with per-sample normalized gradients, the step is made by the backend."""
+    name = 'gd'
+
+    def __init__(self, evaluator: Evaluator, learning_rate: float = 2.):
+        super().__init__(evaluator)
+        self.learning_rate = learning_rate
+
+    def start(self, x: 'ndarray', active: Sequence[int]):
+        self.x = x.astype('float64')
+        self.losses = np.full(len(x), np.nan)
+
+    def step(self, active: Sequence[int]):
+        active = list(active)
+        self.losses[active], self.x[active] = self.evaluator.gradient_step(self.x[active], active, self.learning_rate)
+
+
+OPTIMIZERS: Dict[str, Type[Optimizer]] = {optimizer.name: optimizer for optimizer in (LBFGS, Adam, GradientDescent)}
+
+
+def make_optimizer(name: str, evaluator: Evaluator, **options) -> Optimizer:
+    if name not in OPTIMIZERS:
+        raise ValueError(f'Unknown optimizer {name}, use one of: {", ".join(OPTIMIZERS)}')
+    return OPTIMIZERS[name](evaluator, **options)
+
+
+class EarlyStopping:
+    """Loss plateau detection: a sample stops, when its relative loss improvement
+    stays below min_delta for patience checks in a row.
+    """
+
+    def __init__(self, patience: int = 2, min_delta: float = 1e-3):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best: Dict[int, float] = {}
+        self.wait: Dict[int, int] = {}
+
+    def reset(self):
+        self.best = {}
+        self.wait = {}
+
+    def converged(self, index: int, loss_value: float) -> bool:
+        best = self.best.get(index)
+        if best is None or loss_value < best * (1 - self.min_delta):
+            self.wait[index] = 0
+        else:
+            self.wait[index] = self.wait.get(index, 0) + 1
+        self.best[index] = loss_value if best is None else min(best, loss_value)
+        return self.wait[index] >= self.patience
@@ -1,8 +1,12 @@
+from typing import Tuple
+
 import numpy as np
 from numpy import ndarray
-from keras_preprocessing.image import load_img, img_to_array
+from PIL import Image
 from keras.applications import vgg19
 
+BGR_MEANS = np.array([103.939, 116.779, 123.68], dtype='float32')  # subtracted by VGG19 preprocessing
+
 
 class ProcessImage:
 
@@ -10,13 +14,30 @@ class ProcessImage:
         self.img_height = img_height
         self.img_width = img_width
 
-    def preprocess_image(self, image_path: str) -> ndarray:
-        img = load_img(image_path, target_size=(self.img_height, self.img_width))
-        img = img_to_array(img)
+    @staticmethod
+    def image_size(image_path: str) -> Tuple[int, int]:
+        """(width, height) of the image from its header, pixels are not decoded"""
+        with Image.open(image_path) as img:
+            return img.size
+
+    @staticmethod
+    def decode(image_path: str, min_height: int, min_width: int) -> 'Image.Image':
+        """Decode the image to RGB, JPEG is decoded at the smallest scale not less than the given size"""
+        with Image.open(image_path) as img:
+            img.draft('RGB', (min_width, min_height))
+            return img.convert('RGB')
+
+    def preprocess(self, img: 'Image.Image') -> ndarray:
+        """Resize the decoded image and make the VGG19 input of it"""
+        img = img.resize((self.img_width, self.img_height), Image.NEAREST)
+        img = np.asarray(img, dtype='float32')
         img = np.expand_dims(img, axis=0)
         img = vgg19.preprocess_input(img)
         return img
 
+    def preprocess_image(self, image_path: str) -> ndarray:
+        return self.preprocess(self.decode(image_path, self.img_height, self.img_width))
+
     @staticmethod
     def deprocess_image(img: ndarray) -> ndarray:
         img[:, :, 0] += 103.939
@@ -25,3 +46,26 @@ class ProcessImage:
         img = img[:, :, ::-1]
         img = np.clip(img, 0, 255).astype('uint8')
         return img
+
+    @staticmethod
+    def deprocess_into(x: ndarray, out: ndarray, scratch: ndarray) -> ndarray:
+        """deprocess_image without intermediate arrays:
+        means are added and the range is clipped in place, channels are reversed by the cast into out
+        :param x: flat or (height, width, 3) BGR image of the optimizer, it is not changed
+        :param out: uint8 (height, width, 3) buffer of the RGB result
+        :param scratch: float32 buffer of the out shape
+        """
+        np.add(x.reshape(out.shape), BGR_MEANS, out=scratch, casting='same_kind')
+        np.clip(scratch, 0, 255, out=scratch)
+        np.copyto(out, scratch[..., ::-1], casting='unsafe')
+        return out
+
+    @staticmethod
+    def resize(img: ndarray, img_height: int, img_width: int) -> ndarray:
+        """Bilinear resize of a preprocessed (float) image of shape (height, width, channels)"""
+        channels = [
+            np.asarray(Image.fromarray(img[:, :, channel].astype('float32'), mode='F').resize(
+                (img_width, img_height), Image.BILINEAR))
+            for channel in range(img.shape[2])
+        ]
+        return np.stack(channels, axis=-1)
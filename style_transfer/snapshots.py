@@ -0,0 +1,70 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from PIL import Image
+from numpy import ndarray
+
+
+class SnapshotPolicy:
+    """Which images of a transfer are written and how they are encoded.
+    final: only the result of every sample; every: also every `every`-th iteration;
+    memory: nothing is written, transfer returns result images.
+    """
+    FINAL = 'final'
+    EVERY = 'every'
+    MEMORY = 'memory'
+
+    FORMATS = {'png': 'PNG', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+    def __init__(self, mode: str = FINAL, every: int = 1, image_format: str = 'png', quality: int = 90):
+        """
+        :param every: iterations between snapshots in the `every` mode
+        :param image_format: png, jpeg or webp
+        :param quality: quality of jpeg and webp
+        """
+        if mode not in (self.FINAL, self.EVERY, self.MEMORY):
+            raise ValueError(f'Unknown snapshot mode {mode}.')
+        if image_format not in self.FORMATS:
+            raise ValueError(f'Unknown image format {image_format}.')
+        self.mode = mode
+        self.every = every
+        self.image_format = image_format
+        self.quality = quality
+
+    @property
+    def extension(self) -> str:
+        return 'jpg' if self.image_format == 'jpeg' else self.image_format
+
+    @property
+    def in_memory(self) -> bool:
+        return self.mode == self.MEMORY
+
+    def intermediate(self, iteration: int) -> bool:
+        """Is the image of this iteration written, even if it is not the result"""
+        return self.mode == self.EVERY and iteration % self.every == 0
+
+    def encode(self, path: str, image: 'ndarray'):
+        options = {} if self.image_format == 'png' else {'quality': self.quality}
+        Image.fromarray(image).save(path, self.FORMATS[self.image_format], **options)
+
+
+class SnapshotWriter:
+    """Encodes and writes images on a background thread, so the optimizer does not wait for them"""
+
+    def __init__(self, policy: SnapshotPolicy):
+        self.policy = policy
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def write(self, path: str, image: 'ndarray') -> 'Future':
+        """
+        :param image: uint8 image, must not be changed after the call
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshots')
+        return self.executor.submit(self.policy.encode, path, image)
+
+    def close(self):
+        """Wait for all written images"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -0,0 +1,205 @@
+import resource
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from .batch_transfer import BatchStyleTransfer
+from .evaluator import Evaluator
+from .feature_cache import FeatureCache
+from .input_images import InputImages
+from .model_service import get_model_service
+from .optimizers import make_optimizer
+from .process_image import ProcessImage, BGR_MEANS
+from .snapshots import SnapshotPolicy, SnapshotWriter
+from .style_transfer import StyleTransfer
+
+
+class TiledStyleTransfer(StyleTransfer):
+    """Style transfer of large images by overlapping tiles, so model memory depends on the tile size only.
+    The whole image is first transferred at coarse_height to fix the global composition,
+    then tiles of the upscaled result are optimized against style gram matrices shared by all tiles
+    and blended back with feathered edges.
+    """
+    bytes_per_pixel = 8 * 1024  # estimated VGG19 activations and gradients of one tile pixel
+
+    def __init__(self, target_image_path: str, style_reference_image_path: str, save_path: str,
+                 iterations: int = 10, prefix: str = 'image', img_height: int = 2048, tile_size: int = 512,
+                 overlap: int = 64, memory_budget: Optional[int] = None, coarse_height: Optional[int] = 400,
+                 **options):
+        """
+        :param tile_size: pixels of the tile side, reduced to fit the memory budget
+        :param overlap: pixels shared by neighbour tiles, blended at the seams
+        :param memory_budget: bytes of model memory, tiles are optimized in batches which fit into it
+        :param coarse_height: height of the first pass over the whole image, None to start from the target
+        :param options: see BatchStyleTransfer, levels are not used
+        """
+        super().__init__(target_image_path, style_reference_image_path, save_path, iterations=iterations,
+                         prefix=prefix, img_height=img_height, **options)
+        self.overlap = overlap
+        self.memory_budget = memory_budget
+        self.coarse_height = coarse_height if coarse_height and coarse_height < img_height else None
+
+        tile_pixels = tile_size ** 2
+        if memory_budget is not None:
+            tile_pixels = min(tile_pixels, memory_budget // self.bytes_per_pixel)
+        side = max(2 * overlap + 16, int(tile_pixels ** .5) // 16 * 16)
+        self.tile_height = min(side, self.img_height)
+        self.tile_width = min(side, self.img_width)
+        self.tiles = [(top, left) for top in self.tile_starts(self.img_height, self.tile_height, overlap)
+                      for left in self.tile_starts(self.img_width, self.tile_width, overlap)]
+        tile_bytes = self.tile_height * self.tile_width * self.bytes_per_pixel
+        self.tiles_per_batch = max(1, memory_budget // tile_bytes) if memory_budget is not None else 1
+
+        self.elapsed = None
+
+    @staticmethod
+    def tile_starts(size: int, tile: int, overlap: int) -> List[int]:
+        """Offsets of tiles covering the size, the last tile is aligned to the end"""
+        if size <= tile:
+            return [0]
+        return list(range(0, size - tile, tile - overlap)) + [size - tile]
+
+    def feather(self) -> 'ndarray':
+        """Blending weights of a tile, which fall linearly to the tile edges over the overlap"""
+        def ramp(size: int) -> 'ndarray':
+            distance = np.minimum(np.arange(1, size + 1), np.arange(size, 0, -1))
+            return np.minimum(distance / (self.overlap + 1), 1.).astype('float32')
+        return (ramp(self.tile_height)[:, None] * ramp(self.tile_width)[None, :])[..., None]
+
+    @property
+    def batches(self) -> List[List[Tuple[int, int]]]:
+        return [self.tiles[start:start + self.tiles_per_batch]
+                for start in range(0, len(self.tiles), self.tiles_per_batch)]
+
+    @property
+    def total_iterations(self) -> int:
+        return (self.iterations if self.coarse_height else 0) + len(self.batches) * self.iterations
+
+    def statistics(self) -> dict:
+        statistics = super().statistics()
+        megapixels = self.img_height * self.img_width / 1e6
+        statistics.update({
+            'tiles': len(self.tiles),
+            'tile_size': (self.tile_height, self.tile_width),
+            'tiles_per_batch': self.tiles_per_batch,
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,  # bytes, Linux reports KiB
+            'seconds_per_megapixel': self.elapsed / megapixels if self.elapsed is not None else None
+        })
+        return statistics
+
+    def coarse_image(self, service, callback) -> Optional['ndarray']:
+        """Preprocessed result of the whole image at coarse_height, upscaled to the result size"""
+        if not self.coarse_height:
+            return None
+        coarse = BatchStyleTransfer(self.pairs, self.save_paths, iterations=self.iterations,
+                                    img_height=self.coarse_height,
+                                    img_width=max(16, round(self.img_width * self.coarse_height / self.img_height)),
+                                    service=service, feature_cache=self.feature_cache, optimizer=self.optimizer,
+                                    optimizer_options=self.optimizer_options, steps=self.steps,
+                                    max_evaluations=self.max_evaluations, early_stopping=self.early_stopping,
+                                    snapshots=SnapshotPolicy(SnapshotPolicy.MEMORY),
+                                    decode_workers=self.decode_workers)
+        result = coarse.transfer(callback)[0]
+        if isinstance(result, Exception):
+            raise result
+        self.evaluation_times += coarse.evaluation_times
+        self.evaluations += coarse.evaluations
+        bgr = result[..., ::-1].astype('float32') - BGR_MEANS
+        return ProcessImage.resize(bgr, self.img_height, self.img_width)
+
+    def _transfer(self, writer: SnapshotWriter, inputs: InputImages, callback) -> list:
+        start_time = time.time()
+        try:
+            result = self._transfer_tiles(writer, inputs, callback)
+        except Exception as err:
+            result = err
+        self.elapsed = time.time() - start_time
+        statistics = self.statistics()
+        print(f'Tiled transfer of {len(self.tiles)} tiles completed: '
+              f'{statistics["seconds_per_megapixel"]:.1f} seconds per megapixel, '
+              f'peak RSS {statistics["peak_rss"] / 2 ** 20:.0f} MiB.')
+        return [result]
+
+    def _transfer_tiles(self, writer: SnapshotWriter, inputs: InputImages, callback):
+        """Optimize tiles batch by batch, every batch starts from the blended result of the previous ones"""
+        service = self.service or get_model_service()
+        target_image_path, style_reference_image_path = self.pairs[0]
+        self.last_iterations = [0]
+        self.written = [[]]
+        self.evaluations[:] = 0
+        self.evaluation_times = []
+        self.level_times = []
+
+        target = inputs.preprocess(target_image_path, self.img_height, self.img_width)[0]
+        canvas = self.coarse_image(service, callback)
+        if canvas is None:
+            canvas = target.copy()
+        i = self.iterations if self.coarse_height else 0
+
+        tile_height, tile_width = self.tile_height, self.tile_width
+        style_grams = self.feature_cache.get_or_compute(
+            FeatureCache.key('style', FeatureCache.file_hash(style_reference_image_path), tile_height, tile_width,
+                             service.precision, service.preset),
+            lambda: service.style_grams(inputs.preprocess(style_reference_image_path, tile_height, tile_width))
+        )
+        weights = self.feather()
+        blended = np.zeros_like(canvas)
+        weight_sums = np.zeros(canvas.shape[:2] + (1,), dtype='float32')
+        # callback gets the image blended from the finished batches
+        image = ProcessImage.deprocess_into(canvas, np.empty(canvas.shape, dtype='uint8'),
+                                            np.empty(canvas.shape, dtype='float32'))
+        scratch = np.empty(canvas.shape, dtype='float32')
+        last_write = None
+
+        for batch in self.batches:
+            batch_start_time = time.time()
+            regions = [(slice(top, top + tile_height), slice(left, left + tile_width)) for top, left in batch]
+            features = {
+                index: service.content_features(target[region][np.newaxis]) + style_grams
+                for index, region in enumerate(regions)
+            }
+            evaluations = np.zeros(len(batch), dtype=int)
+            evaluator = Evaluator(service.fetch_loss_and_grads, features, tile_height, tile_width,
+                                  fetch_gradient_step=service.fetch_gradient_step, evaluations=evaluations)
+            optimizer = make_optimizer(self.optimizer, evaluator, **self.optimizer_options)
+            optimizer.start(np.stack([canvas[region].flatten() for region in regions]), list(features))
+            if self.early_stopping:
+                self.early_stopping.reset()
+
+            active = list(features)
+            for _ in range(self.iterations):
+                for _ in range(self.steps):
+                    stepping = [index for index in active
+                                if self.max_evaluations is None or evaluations[index] < self.max_evaluations]
+                    if not stepping:
+                        break
+                    optimizer.step(stepping)
+                if callback:
+                    callback(0, i, float(np.nanmean(optimizer.losses)), image)
+                self.last_iterations[0] = i
+                i += 1
+                if self.early_stopping:
+                    active = [index for index in active
+                              if not self.early_stopping.converged(index, float(optimizer.losses[index]))]
+                if not active:
+                    break
+
+            for index, region in enumerate(regions):
+                blended[region] += weights * optimizer.x[index].reshape((tile_height, tile_width, 3))
+                weight_sums[region] += weights
+                canvas[region] = blended[region] / weight_sums[region]
+            ProcessImage.deprocess_into(canvas, image, scratch)
+            last_write = None
+            if self.snapshots.intermediate(self.last_iterations[0]):
+                last_write = self.write_snapshot(writer, 0, self.last_iterations[0], image.copy())
+
+            self.evaluations[0] += evaluations.sum()
+            self.evaluation_times += evaluator.timings
+            self.level_times.append((tile_height, tile_width, time.time() - batch_start_time))
+            print(f'Tiles {len(self.level_times)} of {len(self.batches)} completed.')
+
+        if self.snapshots.in_memory:
+            return image
+        return last_write or self.write_snapshot(writer, 0, self.last_iterations[0], image)
@@ -0,0 +1,94 @@
+from io import BytesIO
+from os import makedirs, stat
+from os.path import exists, join
+from shutil import rmtree
+from tempfile import mkdtemp, NamedTemporaryFile
+from unittest import TestCase
+
+from PIL import Image
+
+from app import create_app, db
+from app.blob_store import BlobStore, FILE_MODE
+from app.models import User, Role, Images
+from app.renditions import Renditions
+
+
+class BlobStoreTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        Role.insert_roles()
+
+        self.static_folder = mkdtemp()
+        self.blob_store = BlobStore(self.static_folder)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        rmtree(self.static_folder)
+
+    def test_equal_content_stored_once(self):
+        filename = self.blob_store.put_stream(BytesIO(b'image'), '.PNG')
+        self.assertEqual(self.blob_store.put_stream(BytesIO(b'image'), '.png'), filename)
+        self.assertNotEqual(self.blob_store.put_stream(BytesIO(b'other'), '.png'), filename)
+        path = self.blob_store.relative_path(filename)
+        self.assertEqual(path, f'images/blobs/{filename[:2]}/{filename[2:4]}/{filename}')
+        self.assertTrue(exists(self.blob_store.abs_path(path)))
+
+    def test_blobs_are_readable(self):
+        spooled = NamedTemporaryFile(dir=self.static_folder, delete=False)  # 0600 like spooled uploads
+        spooled.write(b'spooled')
+        spooled.close()
+        for filename in (self.blob_store.put_stream(BytesIO(b'image'), '.png'),
+                         self.blob_store.put_file(spooled.name, extension='.png')):
+            mode = stat(self.blob_store.abs_path(self.blob_store.relative_path(filename))).st_mode & 0o777
+            self.assertEqual(mode, FILE_MODE)
+
+    def test_blob_removed_with_last_reference(self):
+        john = User('john', 'john@example.com', 'cat')
+        susan = User('susan', 'susan@example.org', 'dog')
+        filename = self.blob_store.put_stream(BytesIO(b'image'), '.png')
+        images = [Images(filename, john), Images(filename, susan)]
+        db.session.add_all(images)
+        db.session.commit()
+        self.assertEqual(Images.references(filename), 2)
+
+        images[0].delete(self.blob_store)
+        self.assertTrue(exists(self.blob_store.abs_path(images[1].path)))
+        images[1].delete(self.blob_store)
+        self.assertFalse(exists(self.blob_store.abs_path(images[1].path)))
+
+    def test_migrate_saves(self):
+        john = User('john', 'john@example.com', 'cat')
+        db.session.add(Images('old.jpg', john))
+        db.session.commit()
+        saves = join(self.static_folder, 'images', 'john', 'saves')
+        makedirs(saves)
+        for filename in ('old.jpg', 'lost.jpg'):
+            with open(join(saves, filename), 'wb') as file:
+                file.write(b'image')
+
+        self.assertEqual(Images.migrate_saves(self.static_folder), 2)
+        images = john.images.all()
+        self.assertEqual(len(images), 2)
+        self.assertEqual(images[0].filename, images[1].filename)
+        self.assertTrue(exists(self.blob_store.abs_path(images[0].path)))
+        self.assertFalse(exists(join(saves, 'old.jpg')))
+
+    def test_renditions(self):
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400)).save(buffer, 'PNG')
+        buffer.seek(0)
+        image = Images(self.blob_store.put_stream(buffer, '.png'), User('john', 'john@example.com', 'cat'))
+        image.make_renditions(Renditions(self.static_folder, (240, 480, 960)))
+
+        self.assertEqual(image.width, 600)
+        renditions = image.renditions()
+        self.assertEqual([width for width, _ in renditions], [240, 480, 600])
+        for _, path in renditions:
+            self.assertTrue(exists(self.blob_store.abs_path(path)))
@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+from app import create_app, db
+from app.models import User, Role, Post, Comment
+
+
+class CountersTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+        self.john = User('john', 'john@example.com', 'cat')
+        self.post = Post('body', self.john)
+        db.session.add_all([self.john, self.post])
+        db.session.commit()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_post_count(self):
+        self.assertEqual(self.john.post_count, 1)
+        db.session.add(Post('second', self.john))
+        db.session.commit()
+        self.assertEqual(self.john.post_count, 2)
+        db.session.delete(self.post)
+        db.session.commit()
+        self.assertEqual(self.john.post_count, 1)
+
+    def test_comment_count(self):
+        comment = Comment('comment', self.john, self.post)
+        db.session.add_all([comment, Comment('hidden', self.john, self.post, disabled=True)])
+        db.session.commit()
+        self.assertEqual(self.post.comment_count, 1)
+
+        comment.disabled = True
+        db.session.commit()
+        self.assertEqual(self.post.comment_count, 0)
+        comment.disabled = False
+        db.session.commit()
+        self.assertEqual(self.post.comment_count, 1)
+
+        db.session.delete(comment)
+        db.session.commit()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_repair_counters(self):
+        db.session.add(Comment('comment', self.john, self.post))
+        db.session.commit()
+        User.query.update({'post_count': 5})
+        Post.query.update({'comment_count': 0})
+        db.session.commit()
+
+        self.assertEqual(User.repair_post_counts(), 1)
+        self.assertEqual(Post.repair_comment_counts(), 1)
+        self.assertEqual((self.john.post_count, self.post.comment_count), (1, 1))
+        self.assertEqual(User.repair_post_counts(), 0)
@@ -0,0 +1,60 @@
+from importlib.util import find_spec
+from os import listdir
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, skipUnless
+
+import numpy as np
+
+if find_spec('keras'):
+    from style_transfer import FeatureCache
+
+
+@skipUnless(find_spec('keras'), 'style_transfer needs keras')
+class FeatureCacheTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.cache_dir = mkdtemp()
+
+    def tearDown(self) -> None:
+        rmtree(self.cache_dir)
+
+    def arrays(self, value: float) -> list:
+        return [np.full((4, 4), value, dtype='float32'), np.arange(3)]
+
+    def test_memory_lru(self):
+        cache = FeatureCache(max_items=2)
+        cache.put('style-a-1x1', self.arrays(1))
+        cache.put('style-b-1x1', self.arrays(2))
+        cache.get('style-a-1x1')
+        cache.put('style-c-1x1', self.arrays(3))
+        self.assertIsNone(cache.get('style-b-1x1'))
+        self.assertEqual(cache.get('style-a-1x1')[0][0, 0], 1)
+
+    def test_disk_round_trip(self):
+        FeatureCache(self.cache_dir, max_items=0).put('style-a-1x1', self.arrays(1))
+        arrays = FeatureCache(self.cache_dir).get('style-a-1x1')
+        for stored, original in zip(arrays, self.arrays(1)):
+            np.testing.assert_array_equal(stored, original)
+            self.assertEqual(stored.dtype, original.dtype)
+
+    def test_content_features_in_memory_only(self):
+        cache = FeatureCache(self.cache_dir)
+        cache.put(FeatureCache.key('content', 'a', 1, 1), self.arrays(1))
+        self.assertEqual(listdir(self.cache_dir), [])
+        self.assertIsNotNone(cache.get(FeatureCache.key('content', 'a', 1, 1)))
+
+    def test_disk_size(self):
+        file_size = 1024
+        cache = FeatureCache(self.cache_dir, max_items=0, max_disk_size=2 * file_size)
+        for name in 'abc':
+            cache.put(f'style-{name}-1x1', [np.zeros(file_size // 8 - 40)])  # a little less than file_size bytes
+        self.assertEqual(sorted(listdir(self.cache_dir)), ['style-b-1x1.npz', 'style-c-1x1.npz'])
+        self.assertIsNone(cache.get('style-a-1x1'))
+
+    def test_get_or_compute(self):
+        cache = FeatureCache()
+        computed = []
+        for _ in range(2):
+            cache.get_or_compute('style-a-1x1', lambda: computed.append(1) or self.arrays(1))
+        self.assertEqual(len(computed), 1)
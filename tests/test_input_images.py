@@ -0,0 +1,31 @@
+from importlib.util import find_spec
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, skipUnless
+
+from PIL import Image
+
+if find_spec('keras'):
+    from style_transfer.input_images import InputImages
+
+
+@skipUnless(find_spec('keras'), 'style_transfer needs keras')
+class InputImagesTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.folder = mkdtemp()
+        self.target, self.style = join(self.folder, 'target.png'), join(self.folder, 'style.png')
+        Image.new('RGB', (8, 6), 'red').save(self.target)
+        Image.new('RGB', (8, 6), 'blue').save(self.style)
+        self.inputs = InputImages([self.target], 6, 8, workers=1)
+
+    def tearDown(self) -> None:
+        self.inputs.close()
+        rmtree(self.folder)
+
+    def test_style_decoded_on_first_use(self):
+        self.assertIn(self.target, self.inputs.decoded)
+        self.assertNotIn(self.style, self.inputs.decoded)
+        self.assertEqual(self.inputs.image(self.style).getpixel((0, 0)), (0, 0, 255))
+        self.assertEqual(self.inputs.preprocess(self.style, 6, 8).shape, (1, 6, 8, 3))
@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+from app import create_app, db
+from app.markdown_renderer import MarkdownRenderer
+from app.models import User, Role, Post, Comment
+
+
+class MarkdownTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_render_cache(self):
+        renderer = MarkdownRenderer(cache_size=1)
+        html = renderer.render('*body*')
+        self.assertEqual(html, '<p><em>body</em></p>')
+        self.assertIs(renderer.render('*body*'), html)
+        renderer.render('other')
+        self.assertIsNot(renderer.render('*body*'), html)
+        self.assertEqual(renderer.render('*body*'), html)
+
+    def test_rerender(self):
+        john = User('john', 'john@example.com', 'cat')
+        posts = [Post(f'post *{index}*', john) for index in range(5)]
+        db.session.add_all([john, Comment('comment', john, posts[0])] + posts)
+        db.session.commit()
+        Post.query.update({'body_html': ''})
+        db.session.commit()
+
+        self.assertEqual(Post.rerender(workers=2, batch_size=2), 5)
+        self.assertEqual(Comment.rerender(workers=1), 1)
+        db.session.expire_all()
+        self.assertEqual(posts[3].body_html, '<p>post <em>3</em></p>')
+        self.assertEqual(posts[0].comment_count, 1)
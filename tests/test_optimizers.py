@@ -0,0 +1,144 @@
+from importlib.util import find_spec
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, skipUnless
+
+import numpy as np
+from PIL import Image
+
+if find_spec('keras'):
+    from style_transfer import BatchStyleTransfer, EarlyStopping, FeatureCache, SnapshotPolicy
+    from style_transfer.evaluator import Evaluator
+    from style_transfer.optimizers import make_optimizer
+
+HEIGHT, WIDTH = 32, 48  # the smallest transfer size
+
+
+def quadratic_loss_and_grads(inputs: list):
+    """Fake model: loss of every sample is a weighted squared distance of the image to its content feature"""
+    images, goals = inputs[0], inputs[1]
+    weights = np.linspace(.5, 2., images[0].size).reshape(images.shape[1:])  # ill-conditioned on purpose
+    diff = images.astype('float64') - goals
+    return (weights * diff ** 2).sum(axis=(1, 2, 3)), 2 * weights * diff
+
+
+def quadratic_gradient_step(inputs: list):
+    *inputs, learning_rate = inputs
+    losses, grads = quadratic_loss_and_grads(inputs)
+    return losses, inputs[0] - learning_rate * grads
+
+
+class FakeService:
+    """Model service of the quadratic loss, the content feature is the target image moved by 10"""
+    precision = 'float32'
+    preset = 'full'
+    fetch_loss_and_grads = staticmethod(quadratic_loss_and_grads)
+    fetch_gradient_step = staticmethod(quadratic_gradient_step)
+
+    @staticmethod
+    def content_features(image):
+        return [image[0] + 10.]
+
+    @staticmethod
+    def style_grams(image):
+        return []
+
+
+@skipUnless(find_spec('keras'), 'style_transfer needs keras')
+class OptimizersTestCase(TestCase):
+
+    def setUp(self) -> None:
+        rng = np.random.RandomState(0)
+        self.goals = {0: [rng.uniform(-50, 50, (HEIGHT, WIDTH, 3))], 2: [rng.uniform(-50, 50, (HEIGHT, WIDTH, 3))]}
+        self.x = np.zeros((3, HEIGHT * WIDTH * 3))
+
+    def evaluator(self) -> 'Evaluator':
+        return Evaluator(quadratic_loss_and_grads, self.goals, HEIGHT, WIDTH,
+                         fetch_gradient_step=quadratic_gradient_step)
+
+    def minimize(self, name: str, steps: int, **options):
+        evaluator = self.evaluator()
+        optimizer = make_optimizer(name, evaluator, **options)
+        optimizer.start(self.x, [0, 2])
+        initial = optimizer.losses.copy()
+        for _ in range(steps):
+            optimizer.step([0, 2])
+        return optimizer, initial, evaluator
+
+    def test_lbfgs_converges(self):
+        optimizer, initial, _ = self.minimize('lbfgs', 20)
+        self.assertTrue(np.all(optimizer.losses[[0, 2]] < initial[[0, 2]] * 1e-6))
+        np.testing.assert_allclose(optimizer.x[2].reshape(HEIGHT, WIDTH, 3), self.goals[2][0], atol=1e-2)
+        self.assertTrue(np.all(optimizer.x[1] == 0))  # inactive samples are not touched
+
+    def test_adam_converges(self):
+        optimizer, initial, _ = self.minimize('adam', 300, learning_rate=1.)
+        self.assertTrue(np.all(optimizer.losses[[0, 2]] < initial[[0, 2]] * 1e-2))
+
+    def test_gradient_descent_converges(self):
+        optimizer, _, evaluator = self.minimize('gd', 100, learning_rate=.2)
+        losses, _ = evaluator(optimizer.x[[0, 2]], [0, 2])
+        self.assertTrue(np.all(losses < 1e-6))
+
+    def test_unknown_optimizer(self):
+        with self.assertRaises(ValueError):
+            make_optimizer('sgd', self.evaluator())
+
+    def test_evaluator_buffers(self):
+        evaluator = self.evaluator()
+        losses, grads = evaluator(self.x[[0, 2]], [0, 2])
+        self.assertEqual(grads.shape, (2, HEIGHT * WIDTH * 3))
+        same_losses, same_grads = evaluator(self.x[[2]], [2])
+        self.assertTrue(np.shares_memory(same_grads, grads))  # outputs are reused buffers
+        self.assertEqual(same_losses[0], losses[1])  # the subset of features follows sample indices
+        self.assertEqual(evaluator.evaluations.tolist(), [1, 0, 2])
+
+    def test_early_stopping_per_sample(self):
+        early_stopping = EarlyStopping(patience=2, min_delta=.01)
+        for loss_value in (100., 50., 25., 12.):
+            self.assertFalse(early_stopping.converged(0, loss_value))
+        self.assertFalse(early_stopping.converged(1, 10.))
+        self.assertFalse(early_stopping.converged(1, 9.99))
+        self.assertTrue(early_stopping.converged(1, 9.98))
+        self.assertFalse(early_stopping.converged(0, 6.))
+        early_stopping.reset()
+        self.assertFalse(early_stopping.converged(1, 9.98))
+
+
+@skipUnless(find_spec('keras'), 'style_transfer needs keras')
+class BatchStyleTransferTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.folder = mkdtemp()
+        self.pairs = []
+        for index, color in enumerate(('red', 'green')):
+            target, style = join(self.folder, f'target_{index}.png'), join(self.folder, f'style_{index}.png')
+            Image.new('RGB', (WIDTH, HEIGHT), color).save(target)
+            Image.new('RGB', (WIDTH, HEIGHT), 'blue').save(style)
+            self.pairs.append((target, style))
+
+    def tearDown(self) -> None:
+        rmtree(self.folder)
+
+    def transfer(self, **options) -> 'BatchStyleTransfer':
+        options = {'iterations': 5, 'steps': 3, 'optimizer': 'adam', 'service': FakeService(),
+                   'feature_cache': FeatureCache(), 'snapshots': SnapshotPolicy(SnapshotPolicy.MEMORY), **options}
+        style_transfer = BatchStyleTransfer(self.pairs, [self.folder] * 2, img_height=HEIGHT, img_width=WIDTH,
+                                            **options)
+        self.results = style_transfer.transfer()
+        return style_transfer
+
+    def test_results_in_memory(self):
+        self.transfer()
+        self.assertEqual([result.shape for result in self.results], [(HEIGHT, WIDTH, 3)] * 2)
+        self.assertEqual(self.results[0].dtype, np.uint8)
+
+    def test_max_evaluations(self):
+        style_transfer = self.transfer(max_evaluations=4)
+        self.assertEqual(style_transfer.evaluations.tolist(), [4, 4])  # one by start, one by every adam step
+        self.assertEqual(style_transfer.last_iterations, [0, 0])  # three steps of the first iteration
+
+    def test_early_stopping(self):
+        style_transfer = self.transfer(optimizer='lbfgs', iterations=10, early_stopping=EarlyStopping(2, .01))
+        self.assertLess(max(style_transfer.last_iterations), 9)
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from app import create_app, db
+from app.exceptions import InvalidCursor
+from app.models import User, Role, Images, Post
+from app.pagination import KeysetPagination
+
+
+class KeysetPaginationTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        Role.insert_roles()
+
+        self.john = User('john', 'john@example.com', 'cat')
+        now = datetime.utcnow()
+        # pairs of images with equal timestamps
+        for index in range(7):
+            image = Images(f'{index}.png', self.john)
+            image.timestamp = now - timedelta(minutes=index // 2)
+            db.session.add(image)
+        db.session.commit()
+        self.newest_first = Images.query.order_by(Images.timestamp.desc(), Images.id.desc()).all()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_pages_forward_and_backward(self):
+        pages = [KeysetPagination(self.john.images, Images, per_page=3)]
+        while pages[-1].next_cursor:
+            pages.append(KeysetPagination(self.john.images, Images, 3, pages[-1].next_cursor))
+        self.assertEqual([image for page in pages for image in page.items], self.newest_first)
+        self.assertEqual([len(page.items) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0].prev_cursor)
+
+        previous = KeysetPagination(self.john.images, Images, 3, pages[-1].prev_cursor)
+        self.assertEqual(previous.items, pages[1].items)
+        self.assertTrue(previous.has_next)
+        self.assertTrue(previous.has_prev)
+
+    def test_ascending(self):
+        first = KeysetPagination(self.john.images, Images, 4, descending=False)
+        second = KeysetPagination(self.john.images, Images, 4, first.next_cursor, descending=False)
+        self.assertEqual(first.items + second.items, self.newest_first[::-1])
+        self.assertIsNone(second.next_cursor)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            KeysetPagination(self.john.images, Images, 3, 'not a cursor')
+
+    def test_api_cursor_links(self):
+        self.app.config['FLASKY_POSTS_PER_PAGE'] = 2
+        for index in range(3):
+            db.session.add(Post(f'post {index}', self.john))
+        db.session.commit()
+        client = self.app.test_client()
+
+        first = client.get('/api/v1/posts/?count=1').get_json()
+        self.assertEqual(len(first['posts']), 2)
+        self.assertEqual(first['count'], 3)
+        self.assertIsNone(first['prev'])
+        second = client.get(first['next']).get_json()
+        self.assertEqual(len(second['posts']), 1)
+        self.assertNotIn('count', second)
+        self.assertIsNone(second['next'])
+        self.assertEqual(client.get(second['prev']).get_json()['posts'], first['posts'])
+        self.assertEqual(client.get('/api/v1/posts/?cursor=bad').status_code, 400)
+
@@ -0,0 +1,94 @@
+from base64 import b64encode
+from typing import List
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Role, Post, Comment
+
+
+class QueryCounter:
+    """Collects SQL statements executed by the engine inside the with block"""
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self) -> 'QueryCounter':
+        event.listen(db.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(db.engine, 'before_cursor_execute', self._count)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+class QueryCountTestCase(TestCase):
+    """Listings must run the same count of statements for any count of posts on the page"""
+
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+        john = User('john', 'john@example.com', 'cat', confirmed=True)
+        db.session.add(john)
+        db.session.commit()
+        self.john_id = john.id
+        self.authors = 0
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_posts(self, count: int):
+        """Posts of john and new authors, commented by each other, john follows the authors"""
+        john = User.query.get(self.john_id)
+        for _ in range(count):
+            self.authors += 1
+            author = User(f'author{self.authors}', f'author{self.authors}@example.com', 'dog')
+            post = Post('Post *body*', author)
+            john_post = Post('John *body*', john)
+            db.session.add_all([author, post, john_post, Comment('Comment', john, post),
+                                Comment('Comment', author, john_post)])
+            db.session.commit()
+            john.follow(author)
+
+    def queries(self, url: str, **kwargs) -> int:
+        db.session.remove()  # the request loads everything itself
+        with QueryCounter() as counter:
+            response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return counter.count
+
+    def assertConstantQueries(self, url: str, **kwargs):
+        self.add_posts(2)
+        few_posts = self.queries(url, **kwargs)
+        self.add_posts(8)
+        self.assertEqual(self.queries(url, **kwargs), few_posts)
+
+    def api_headers(self) -> dict:
+        credentials = b64encode(b'john@example.com:cat').decode('utf-8')
+        return {'Authorization': f'Basic {credentials}', 'Accept': 'application/json'}
+
+    def test_index(self):
+        self.assertConstantQueries('/')
+
+    def test_user_page(self):
+        self.assertConstantQueries('/user/john')
+
+    def test_api_posts(self):
+        self.assertConstantQueries('/api/v1/posts/', headers=self.api_headers())
+
+    def test_api_timeline(self):
+        self.assertConstantQueries(f'/api/v1/users/{self.john_id}/timeline/', headers=self.api_headers())
@@ -0,0 +1,105 @@
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Role, Post, TimelineEntry
+from app.pagination import MergedKeysetPagination
+
+
+class TimelineTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+        self.john = User('john', 'john@example.com', 'cat')
+        self.susan = User('susan', 'susan@example.com', 'dog')
+        self.post = Post('susan post', self.susan)
+        db.session.add_all([self.john, self.susan, self.post])
+        db.session.commit()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def timeline(self, user: User) -> set:
+        return {post.body for post in user.followed_posts}
+
+    def test_fan_out(self):
+        self.assertEqual(self.timeline(self.john), set())
+        self.john.follow(self.susan)
+        self.assertEqual(self.timeline(self.john), {'susan post'})
+        db.session.add_all([Post('new post', self.susan), Post('john post', self.john)])
+        db.session.commit()
+        self.assertEqual(self.timeline(self.john), {'susan post', 'new post', 'john post'})
+        self.john.unfollow(self.susan)
+        self.assertEqual(self.timeline(self.john), {'john post'})
+        db.session.delete(self.post)
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.filter_by(post_id=self.post.id).count(), 0)
+
+    def test_delete_post_with_foreign_keys(self):
+        def enforce_foreign_keys(connection, record):
+            connection.execute('PRAGMA foreign_keys=ON')
+        event.listen(db.engine, 'connect', enforce_foreign_keys)
+        self.addCleanup(db.engine.dispose)
+        self.addCleanup(event.remove, db.engine, 'connect', enforce_foreign_keys)
+        john_id, post_id = self.john.id, self.post.id
+        db.session.remove()
+        db.engine.dispose()  # new connections enforce foreign keys
+
+        john, post = User.query.get(john_id), Post.query.get(post_id)
+        john.follow(post.author)
+        self.assertEqual(TimelineEntry.query.filter_by(post_id=post.id).count(), 2)
+        db.session.delete(post)
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.filter_by(post_id=post_id).count(), 0)
+        self.assertEqual(self.timeline(john), set())
+
+    def test_read_popular_authors(self):
+        self.app.config['FLASKY_TIMELINE_FANOUT_LIMIT'] = 1  # susan follows herself
+        self.john.follow(self.susan)
+        self.assertFalse(self.susan.timeline_fanout)
+        db.session.add(Post('new post', self.susan))
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.john.id).count(), 0)
+        self.assertEqual(self.timeline(self.john), {'susan post', 'new post'})
+
+    def test_rebuild(self):
+        self.john.follow(self.susan)
+        TimelineEntry.query.delete()
+        db.session.commit()
+        self.assertEqual(self.timeline(self.john), set())
+        self.assertEqual(TimelineEntry.rebuild(), 2)
+        self.assertEqual(self.timeline(self.john), {'susan post'})
+
+    def test_merged_pages(self):
+        self.app.config['FLASKY_TIMELINE_FANOUT_LIMIT'] = 2  # users follow themselves
+        mary = User('mary', 'mary@example.com', 'bird')
+        db.session.add(mary)
+        db.session.commit()
+        self.susan.follow(self.john)  # john fans out, susan has more followers than the limit
+        self.john.follow(self.susan)
+        mary.follow(self.susan)
+        self.assertTrue(self.john.timeline_fanout)
+        self.assertFalse(self.susan.timeline_fanout)
+        for index in range(3):
+            db.session.add_all([Post(f'john {index}', self.john), Post(f'susan {index}', self.susan)])
+            db.session.commit()
+
+        newest = [post.body for post in self.susan.followed_posts.order_by(Post.timestamp.desc(), Post.id.desc())]
+        bodies, cursor = [], None
+        while True:
+            page = MergedKeysetPagination(self.susan.timeline_sources(), 2, cursor)
+            bodies += [post.body for post in page.items]
+            cursor = page.next_cursor
+            if not cursor:
+                break
+        self.assertEqual(bodies, newest)
+        self.assertEqual(len(bodies), 7)
+        self.assertEqual(page.total, 7)
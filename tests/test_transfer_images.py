@@ -0,0 +1,77 @@
+from importlib.util import find_spec
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, skipUnless
+
+import numpy as np
+from PIL import Image
+
+if find_spec('keras'):
+    from style_transfer import SnapshotPolicy, TiledStyleTransfer
+    from style_transfer.process_image import ProcessImage, BGR_MEANS
+
+
+@skipUnless(find_spec('keras'), 'style_transfer needs keras')
+class TransferImagesTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.folder = mkdtemp()
+
+    def tearDown(self) -> None:
+        rmtree(self.folder)
+
+    def test_snapshot_policy(self):
+        every = SnapshotPolicy(SnapshotPolicy.EVERY, every=3, image_format='jpeg')
+        self.assertEqual([iteration for iteration in range(7) if every.intermediate(iteration)], [0, 3, 6])
+        self.assertEqual(every.extension, 'jpg')
+        self.assertFalse(SnapshotPolicy().intermediate(0))
+        self.assertTrue(SnapshotPolicy(SnapshotPolicy.MEMORY).in_memory)
+        with self.assertRaises(ValueError):
+            SnapshotPolicy('sometimes')
+        with self.assertRaises(ValueError):
+            SnapshotPolicy(image_format='gif')
+
+    def test_snapshot_encode(self):
+        image = np.zeros((4, 6, 3), dtype='uint8')
+        image[..., 0] = 200
+        path = join(self.folder, 'image.png')
+        SnapshotPolicy().encode(path, image)
+        with Image.open(path) as stored:
+            np.testing.assert_array_equal(np.asarray(stored), image)
+
+    def test_deprocess_into(self):
+        x = np.random.RandomState(0).uniform(-200, 200, (4, 6, 3))
+        out = np.empty((4, 6, 3), dtype='uint8')
+        result = ProcessImage.deprocess_into(x.flatten(), out, np.empty((4, 6, 3), dtype='float32'))
+        self.assertIs(result, out)
+        expected = np.clip(x + BGR_MEANS, 0, 255)[..., ::-1].astype('uint8')
+        np.testing.assert_array_equal(out, expected)
+
+    def test_tiles(self):
+        self.assertEqual(TiledStyleTransfer.tile_starts(100, 100, 8), [0])
+        self.assertEqual(TiledStyleTransfer.tile_starts(100, 48, 8), [0, 40, 52])
+
+        target = join(self.folder, 'target.png')
+        Image.new('RGB', (150, 100)).save(target)
+        tiled = TiledStyleTransfer(target, target, self.folder, img_height=100, tile_size=48, overlap=8,
+                                   coarse_height=None)
+        covered = np.zeros((tiled.img_height, tiled.img_width), dtype=bool)
+        for top, left in tiled.tiles:
+            covered[top:top + tiled.tile_height, left:left + tiled.tile_width] = True
+        self.assertTrue(covered.all())
+
+        weights = tiled.feather()
+        self.assertEqual(weights.shape, (tiled.tile_height, tiled.tile_width, 1))
+        self.assertEqual(weights[tiled.tile_height // 2, tiled.tile_width // 2, 0], 1)
+        self.assertLess(weights[0, 0, 0], weights[tiled.overlap, tiled.overlap, 0])
+        self.assertGreater(weights.min(), 0)
+
+    def test_tiles_per_memory_budget(self):
+        target = join(self.folder, 'target.png')
+        Image.new('RGB', (150, 100)).save(target)
+        budget = 3 * 48 * 48 * TiledStyleTransfer.bytes_per_pixel
+        tiled = TiledStyleTransfer(target, target, self.folder, img_height=100, tile_size=48, overlap=8,
+                                   memory_budget=budget, coarse_height=None)
+        self.assertEqual(tiled.tiles_per_batch, 3)
+        self.assertEqual(sum(len(batch) for batch in tiled.batches), len(tiled.tiles))
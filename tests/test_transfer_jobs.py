@@ -0,0 +1,221 @@
+from datetime import datetime, timedelta
+from io import BytesIO
+from os.path import exists
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+from unittest import TestCase
+
+from app import create_app, db
+from app.exceptions import JobRejected
+from app.images_path import ImagesPath
+from app.blob_store import BlobStore
+from app.models import User, Role, TransferJob, JobStatus, TransferArtifact, TransferResult
+
+
+class TransferJobTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app.config['TRANSFER_QUEUE_MAX_DEPTH'] = 3
+        self.app.config['TRANSFER_MAX_JOBS_PER_USER'] = 2
+        self.app.config['TRANSFER_MAX_RUNNING_PER_USER'] = 1
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        Role.insert_roles()
+
+        self.john = User('john', 'john@example.com', 'cat')
+        self.susan = User('susan', 'susan@example.org', 'dog')
+        db.session.add_all([self.john, self.susan])
+        db.session.commit()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def submit(self, user: User) -> TransferJob:
+        return TransferJob.submit(user, 'target.jpg', 'style.jpg', iterations=1)
+
+    def test_submit(self):
+        job = self.submit(self.john)
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertEqual(job.author, self.john)
+
+    def test_user_jobs_limit(self):
+        self.submit(self.john)
+        self.submit(self.john)
+        with self.assertRaises(JobRejected):
+            self.submit(self.john)
+
+    def test_queue_depth(self):
+        self.submit(self.john)
+        self.submit(self.john)
+        self.submit(self.susan)
+        with self.assertRaises(JobRejected):
+            self.submit(self.susan)
+
+    def test_claim(self):
+        job = self.submit(self.john)
+        claimed = TransferJob.claim('worker')
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.status, JobStatus.RUNNING)
+        self.assertIsNone(TransferJob.claim('worker'))
+
+    def test_claim_running_per_user(self):
+        john_job = self.submit(self.john)
+        TransferJob.submit(self.john, 'target.jpg', 'style.jpg', iterations=2)
+        susan_job = TransferJob.submit(self.susan, 'target.jpg', 'other_style.jpg', iterations=1)
+        self.assertEqual(TransferJob.claim('worker').id, john_job.id)
+        self.assertEqual(TransferJob.claim('worker').id, susan_job.id)
+        self.assertIsNone(TransferJob.claim('worker'))
+
+    def test_cancel(self):
+        job = self.submit(self.john)
+        self.assertTrue(job.cancel())
+        db.session.refresh(job)
+        self.assertEqual(job.status, JobStatus.CANCELLED)
+        self.assertIsNone(TransferJob.claim('worker'))
+        self.assertFalse(job.finish('result.png'))
+
+    def test_report_progress(self):
+        job = self.submit(self.john)
+        self.assertFalse(TransferJob.report_progress(job.id, 0, 10., 5., b'jpeg'))
+        TransferJob.claim('worker')
+        self.assertTrue(TransferJob.report_progress(job.id, 0, 10., 5., b'jpeg'))
+        db.session.refresh(job)
+        self.assertEqual((job.iteration, job.loss, job.preview), (0, 10., b'jpeg'))
+        job.cancel()
+        self.assertFalse(TransferJob.report_progress(job.id, 1, 9., 4., b'jpeg'))
+
+    def test_progress(self):
+        job = self.submit(self.john)
+        TransferJob.claim('worker')
+        TransferJob.report_progress(job.id, 0, float('inf'), 5., b'jpeg')
+        with self.app.test_request_context():
+            progress = TransferJob.progress(job.id)
+            self.assertEqual((progress['status'], progress['iteration'], progress['loss']),
+                             (JobStatus.RUNNING, 0, None))
+            self.assertIsNone(TransferJob.progress(job.id + 1))
+
+    def test_collect_garbage(self):
+        static_folder = mkdtemp()
+        self.addCleanup(rmtree, static_folder)
+        image_path = ImagesPath('john', static_folder)
+        image_path.make_dir(image_path.model_buffer())
+        result = image_path.convert(image_path.model_buffer('job_1_at_iteration_0.png'))
+        orphan = image_path.model_buffer('orphan.png', absolute=True)
+        for path in (image_path.abs_path(result), orphan):
+            open(path, 'wb').close()
+
+        job = self.submit(self.john)
+        TransferJob.claim('worker')
+        job.finish(result)
+        self.assertEqual(job.artifacts.count(), 3)
+        self.assertEqual(TransferArtifact.collect_garbage(static_folder, datetime.utcnow() - timedelta(hours=1)), 0)
+
+        removed = TransferArtifact.collect_garbage(static_folder, datetime.utcnow() + timedelta(seconds=1))
+        self.assertEqual(removed, 2)
+        self.assertEqual(job.artifacts.count(), 0)
+        self.assertFalse(exists(orphan))
+
+    def make_result(self, content: bytes) -> str:
+        self.app.static_folder = mkdtemp()
+        self.addCleanup(rmtree, self.app.static_folder)
+        blob_store = BlobStore(self.app.static_folder)
+        path = blob_store.abs_path('result.png')
+        with open(path, 'wb') as file:
+            file.write(content)
+        return blob_store.relative_path(blob_store.put_file(path, move=True))
+
+    def test_result_cache(self):
+        result = self.make_result(b'result')
+        job = self.submit(self.john)
+        equal_job = self.submit(self.susan)
+        self.assertEqual(job.cache_key, equal_job.cache_key)
+        self.assertEqual(TransferJob.claim('worker').id, job.id)
+        self.assertIsNone(TransferJob.claim('worker'))
+
+        job.finish(result)
+        TransferResult.store(job.cache_key, result)
+        self.assertEqual(TransferResult.lookup(equal_job.cache_key).result_image, result)
+
+        cached_job = self.submit(self.john)
+        self.assertEqual(cached_job.status, JobStatus.DONE)
+        self.assertEqual(cached_job.result_image, result)
+        other_job = TransferJob.submit(self.john, 'target.jpg', 'style.jpg', iterations=2)
+        self.assertEqual(other_job.status, JobStatus.QUEUED)
+
+    def test_evict_results(self):
+        old_result = self.make_result(b'old')
+        blob_store = BlobStore(self.app.static_folder)
+        path = blob_store.abs_path('new.png')
+        with open(path, 'wb') as file:
+            file.write(b'new')
+        new_result = blob_store.relative_path(blob_store.put_file(path, move=True))
+
+        self.app.config['TRANSFER_RESULT_CACHE_SIZE'] = 4
+        TransferResult.store('old', old_result)
+        TransferResult.store('new', new_result)
+        self.assertIsNone(TransferResult.lookup('old'))
+        self.assertFalse(exists(blob_store.abs_path(old_result)))
+        self.assertEqual(TransferResult.lookup('new').result_image, new_result)
+
+
+    def test_requeue_stale(self):
+        job = self.submit(self.john)
+        other_job = TransferJob.submit(self.susan, 'target.jpg', 'style.jpg', iterations=2)
+        TransferJob.claim('host:1')
+        TransferJob.claim('host:2')
+        self.assertEqual(TransferJob.requeue_stale(['host:1']), 1)
+        db.session.refresh(job)
+        db.session.refresh(other_job)
+        self.assertEqual((job.status, job.worker), (JobStatus.QUEUED, None))
+        self.assertEqual(other_job.status, JobStatus.RUNNING)
+
+    def test_claim_batch(self):
+        self.app.config['TRANSFER_MAX_RUNNING_PER_USER'] = 2
+        self.app.config['TRANSFER_QUEUE_MAX_DEPTH'] = 4
+        first = TransferJob.submit(self.john, 'target.jpg', 'style.jpg', iterations=1)
+        other_size = TransferJob.submit(self.john, 'wide.jpg', 'style.jpg', iterations=1)
+        same_size = TransferJob.submit(self.susan, 'target.jpg', 'other_style.jpg', iterations=1)
+        TransferJob.submit(self.susan, 'target.jpg', 'style_2.jpg', iterations=2)
+        jobs = TransferJob.claim_batch('worker', 4, lambda job: job.target_image)
+        self.assertEqual([job.id for job in jobs], [first.id, same_size.id])
+        self.assertEqual(TransferJob.claim('worker').id, other_size.id)
+
+    def test_evict_only_freeable_results(self):
+        used_result = self.make_result(b'used')
+        job = self.submit(self.john)
+        TransferJob.claim('worker')
+        job.finish(used_result)
+        blob_store = BlobStore(self.app.static_folder)
+        path = blob_store.abs_path('new.png')
+        with open(path, 'wb') as file:
+            file.write(b'new')
+        new_result = blob_store.relative_path(blob_store.put_file(path, move=True))
+
+        self.app.config['TRANSFER_RESULT_CACHE_SIZE'] = 4
+        TransferResult.store('used', used_result)
+        TransferResult.store('new', new_result)
+        self.assertIsNotNone(TransferResult.lookup('used'))  # the job keeps the file, evicting frees nothing
+        self.assertIsNotNone(TransferResult.lookup('new'))
+        self.assertEqual(TransferResult.evict(0), 1)
+        self.assertIsNone(TransferResult.lookup('new'))
+        self.assertFalse(exists(blob_store.abs_path(new_result)))
+        self.assertTrue(exists(blob_store.abs_path(used_result)))
+
+    def test_collect_unreferenced_blobs(self):
+        self.app.static_folder = mkdtemp()
+        self.addCleanup(rmtree, self.app.static_folder)
+        blob_store = BlobStore(self.app.static_folder)
+        rejected = blob_store.relative_path(blob_store.put_stream(BytesIO(b'rejected'), '.png'))
+        used = blob_store.relative_path(blob_store.put_stream(BytesIO(b'used'), '.png'))
+        TransferJob.submit(self.john, used, used, iterations=1)
+
+        self.assertEqual(TransferArtifact.collect_blobs(self.app.static_folder, time() - 3600), 0)
+        self.assertEqual(TransferArtifact.collect_blobs(self.app.static_folder, time() + 1), 1)
+        self.assertFalse(exists(blob_store.abs_path(rejected)))
+        self.assertTrue(exists(blob_store.abs_path(used)))
@@ -0,0 +1,48 @@
+from io import BytesIO
+from os import listdir
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from app import create_app, db
+from app.models import Role
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(64)
+
+
+class UploadTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['UPLOAD_LIMITS'] = {'uploads.upload': 1024}
+        self.app.static_folder = mkdtemp()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        rmtree(self.app.static_folder)
+
+    def upload(self, content: bytes, filename: str = 'photo.png'):
+        return self.client.post('/uploads/upload', data={'photo': (BytesIO(content), filename)},
+                                content_type='multipart/form-data')
+
+    def test_image_is_stored_by_content(self):
+        response = self.upload(PNG, 'photo.PNG')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('images/blobs/', response.get_data(as_text=True))
+        self.assertEqual(listdir(join(self.app.static_folder, 'images', 'spool')), [])
+
+    def test_not_image_is_rejected(self):
+        self.assertEqual(self.upload(b'#!/bin/sh\necho hello\n', 'photo.png').status_code, 415)
+
+    def test_too_large_body_is_rejected(self):
+        self.assertEqual(self.upload(PNG + bytes(2048)).status_code, 413)